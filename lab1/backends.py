@@ -0,0 +1,291 @@
+import os
+import re
+import sys
+import time
+
+from lexer import check, code_table, lex, lookahead, read_chunks, separator_token, write_tables, write_tokens
+from dfa import lex_table
+from speccache import fresh_tokens, load_compiled, spec_tuple
+from tokenfile import text_codes, write_binary
+
+ALPHA = r'[^\W\d_]'
+ANY = r'[\s\S]'
+EXPONENT = re.compile(r'[eE][^-+\d]*([-+]?)([\s\S]*)')
+
+
+# Лексеры из BACKENDS принимают части текста, таблицы лексем этого
+# прогона и скомпилированную спецификацию (speccache.CompiledSpec)
+
+
+def lex_fsm(chunks, tokens, spec, trace=None):
+    return lex(chunks, tokens, *spec_tuple(spec), trace)
+
+
+def lex_dfa(chunks, tokens, spec, trace=None, store=None):
+    return lex_table(chunks, tokens, spec.dfa, trace, store)
+
+
+def compile_master_pattern(operations, separators):
+    """Одно регулярное выражение, повторяющее автомат из lexer.lex.
+    Каждое совпадение - путь автомата из состояния S обратно в S.
+    Именованные группы отмечают пути, которые выдают лексемы; пути без
+    групп (отброшенные символы, незавершённые лексемы в конце текста)
+    ничего не выдают."""
+    ops = sorted(operations, key=len, reverse=True)
+    seps = [separator for separator in separators if len(separator) == 1]
+    # операция не может стоять последним символом текста
+    op = '(?:%s)(?=%s)' % ('|'.join(map(re.escape, ops)), ANY) if ops else '(?!)'
+    sep = '[%s]' % ''.join(map(re.escape, seps)) if seps else '(?!)'
+    term = '(?:%s|%s)' % (op, sep)
+
+    # Автомат детерминирован, поэтому все повторения - захватывающие
+    # (*+, ++): откат внутрь них не нужен и на длинных текстах дорог.
+    # q3 (целая часть), q4-q5 (дробная), q6-q8 (порядок); символы, на
+    # которые у состояния нет перехода, пропускаются
+    integer = r'\d(?:\d|(?![.eE]|%s)%s)*+' % (term, ANY)
+    fraction = r'\.\D*+\d(?:\d|(?![eE]|%s)%s)*+' % (term, ANY)
+    exponent = r'[eE][^-+\d]*+(?:[-+]\D*+)?\d++'
+
+    alternatives = [
+        # q1 -> q2: идентификатор с цифрой, дальше до операции или разделителя
+        r'(?P<ident>(?P<ident_text>%s++\d(?:(?!%s)%s)*+)(?:(?P<ident_op>%s)|(?P<ident_sep>%s)|\Z))'
+        % (ALPHA, term, ANY, op, sep),
+        # q1: слово; на прочем символе слово отбрасывается
+        r'(?P<word>(?P<word_text>%s++)(?:(?P<word_op>%s)|(?P<word_sep>%s)|%s|\Z))' % (ALPHA, op, sep, ANY),
+        # q4, q6, q7 до конца текста
+        r'%s(?:\.\D*+\Z|(?:%s)?[eE][^-+\d]*+(?:[-+]\D*+)?\Z)' % (integer, fraction),
+        r'(?P<num>(?P<num_int>%s)(?P<num_frac>%s)?(?P<num_exp>%s)?(?:(?P<num_op>%s)|(?P<num_sep>%s)|%s|\Z))'
+        % (integer, fraction, exponent, op, sep, ANY),
+        r"(?P<string>'[^']*+')",
+        r"'[^']*+\Z",
+        r'(?P<comment>#(?P<comment_body>[^\n]*+)(?P<comment_end>\n)?)',
+        r'(?P<op>%s)' % op,
+    ]
+    if ' ' in seps:
+        # q16: после одного пробела следующий символ пропускается,
+        # несколько пробелов - отступ
+        alternatives += [r' {2,}+\Z', r' (?! )%s?' % ANY, r'(?P<indent> {2,}+)']
+    alternatives += [r'(?P<sep>%s)' % sep, ANY]
+    return re.compile('|'.join(alternatives))
+
+
+def digits(text):
+    if text.isdigit():
+        return text
+    return ''.join(symbol for symbol in text if symbol.isdigit())
+
+
+def number_text(integer, fraction, exponent):
+    # буфер q3-q8 - только символы, по которым был переход
+    buffer = digits(integer)
+    if fraction:
+        buffer += '.' + digits(fraction)
+    if exponent:
+        sign, rest = EXPONENT.match(exponent).groups()
+        buffer += exponent[0] + sign + digits(rest)
+    return buffer
+
+
+def flush_tail(tokens, separators, operation, separator):
+    if operation:
+        check(tokens, 'O', operation)
+        yield tokens['O'][operation] + ' '
+        separator = operation[0] if operation[0] in separators else ''
+    if separator and separator != ' ':
+        yield separator_token(tokens, separator)
+
+
+def lex_regex(chunks, tokens, spec):
+    """Лексер на одном регулярном выражении (compile_master_pattern) и
+    finditer. Выдаёт те же фрагменты tokens.txt, что и lexer.lex."""
+    service_words, operations, separators = spec_tuple(spec)
+    pattern = compile_master_pattern(operations, separators)
+    margin = lookahead(operations)
+    source = iter(chunks)
+    # части текста, ещё не прогнанные через finditer, и их общая длина
+    parts = []
+    size = 0
+    # хвост прошлого прохода: лексема, которая не кончилась в окне
+    # (например, строка после одиночной '), разбирается заново с начала,
+    # поэтому окно прогоняется снова только тогда, когда выросло вдвое, -
+    # иначе длинная лексема стоила бы квадратичного времени
+    carried = 0
+    eof = False
+    while not eof:
+        chunk = next(source, None)
+        if chunk is None:
+            eof = True
+        else:
+            parts.append(chunk)
+            size += len(chunk)
+            if size < 2 * carried:
+                continue
+        input_sequence = ''.join(parts)
+        # совпадение у конца окна может измениться после следующей части
+        limit = len(input_sequence) if eof else len(input_sequence) - margin
+        position = 0
+        for m in pattern.finditer(input_sequence):
+            if m.end() > limit:
+                break
+            position = m.end()
+            kind = m.lastgroup
+            if kind is None:
+                continue
+            if kind == 'word':
+                operation, separator = m.group('word_op', 'word_sep')
+                if operation or separator:
+                    # Семантическая процедура 1
+                    buffer = m.group('word_text')
+                    if buffer in service_words:
+                        yield tokens['W'][buffer] + ' '
+                    elif buffer in operations:
+                        yield tokens['O'][buffer] + ' '
+                    else:
+                        check(tokens, 'I', buffer)
+                        yield tokens['I'][buffer] + ' '
+                    yield from flush_tail(tokens, separators, operation, separator)
+            elif kind == 'sep':
+                # Семантическая процедура 6
+                yield separator_token(tokens, m.group('sep'))
+            elif kind == 'op':
+                # Семантическая процедура 5
+                operation = m.group('op')
+                check(tokens, 'O', operation)
+                yield tokens['O'][operation] + ' '
+            elif kind == 'indent':
+                if len(m.group('indent')) % 4 != 0:
+                    raise Exception('Bad tabulation')
+                for k in range(0, len(m.group('indent')) // 4):
+                    yield tokens['R']['\t'] + ' '
+            elif kind == 'num':
+                operation, separator = m.group('num_op', 'num_sep')
+                if operation or separator:
+                    # Семантические процедуры 2 и 3
+                    buffer = number_text(*m.group('num_int', 'num_frac', 'num_exp'))
+                    check(tokens, 'N', buffer)
+                    yield tokens['N'][buffer] + ' '
+                    yield from flush_tail(tokens, separators, operation, separator)
+            elif kind == 'ident':
+                operation, separator = m.group('ident_op', 'ident_sep')
+                if operation or separator:
+                    text = m.group('ident_text')
+                    buffer = text if text.isalnum() else ''.join(symbol for symbol in text if symbol.isalnum())
+                    check(tokens, 'I', buffer)
+                    yield tokens['I'][buffer] + ' '
+                    yield from flush_tail(tokens, separators, operation, separator)
+            elif kind == 'string':
+                # Семантическая процедура 4
+                buffer = m.group('string')
+                check(tokens, 'C', buffer)
+                yield tokens['C'][buffer] + ' '
+            elif kind == 'comment':
+                if m.group('comment_end') or m.group('comment_body'):
+                    yield '\n'
+        parts = [input_sequence[position:]]
+        size = carried = len(parts[0])
+
+
+BACKENDS = {
+    'fsm': lex_fsm,
+    'table': lex_dfa,
+    'regex': lex_regex,
+}
+
+# лексеры с состояниями S, q1...q16, которые принимают trace
+TRACEABLE = ('fsm', 'table')
+# лексеры, которые заполняют tokenstore.TokenStore
+POSITIONAL = ('table',)
+
+
+class LexResult:
+    """Результат разбора в памяти: output - текст tokens.txt, tokens -
+    таблицы лексем по классам (значение -> код), store -
+    tokenstore.TokenStore с местами лексем в тексте, если он был задан."""
+
+    def __init__(self, output, tokens, store=None):
+        self.output = output
+        self.tokens = tokens
+        self.store = store
+
+    def table(self, token_class):
+        return code_table(self.tokens[token_class])
+
+    def export(self, directory, binary=False):
+        # то же, что раньше всегда писал prog: tokens.txt и W.json ... C.json;
+        # binary - также tokens.bin (tokenfile.write_binary)
+        write_tokens((self.output,), os.path.join(directory, 'tokens.txt'))
+        write_tables(self.tokens, directory)
+        if binary:
+            write_binary(os.path.join(directory, 'tokens.bin'), self.tokens, text_codes(self.output), self.store)
+
+
+class Lexer:
+    """Один прогон лексера BACKENDS[backend] со своими таблицами лексем.
+    Спецификация spec (speccache.CompiledSpec) только читается, поэтому
+    одну спецификацию могут одновременно использовать лексеры в разных
+    потоках без блокировок. tokens - таблицы, которые дополняются при
+    разборе (по умолчанию - новые, speccache.fresh_tokens); trace -
+    tracing.Trace, только для лексеров из TRACEABLE; store -
+    tokenstore.TokenStore, только для лексеров из POSITIONAL."""
+
+    def __init__(self, spec, backend='regex', tokens=None, trace=None, store=None):
+        if backend not in BACKENDS:
+            raise ValueError('unknown backend %s' % backend)
+        if trace is not None and backend not in TRACEABLE:
+            raise ValueError('backend %s does not support tracing' % backend)
+        if store is not None and backend not in POSITIONAL:
+            raise ValueError('backend %s does not record token positions' % backend)
+        self.spec = spec
+        self.backend = backend
+        self.tokens = fresh_tokens(spec) if tokens is None else tokens
+        self.trace = trace
+        self.store = store
+
+    def fragments(self, chunks):
+        # генератор фрагментов tokens.txt для текста, читаемого по частям
+        lex = BACKENDS[self.backend]
+        if self.store is not None:
+            return lex(chunks, self.tokens, self.spec, self.trace, self.store)
+        if self.trace is not None:
+            return lex(chunks, self.tokens, self.spec, self.trace)
+        return lex(chunks, self.tokens, self.spec)
+
+    def lex(self, text):
+        """Разбор исходного текста целиком в памяти, без файлов."""
+        return LexResult(''.join(self.fragments((text,))), self.tokens, self.store)
+
+
+def compare_backends(paths, names=tuple(BACKENDS), resources='./resources'):
+    """Прогоняет каждый файл через все лексеры и сравнивает tokens.txt и
+    таблицы лексем. Возвращает список (файл, {лексер: время}, совпадают ли)."""
+    spec = load_compiled(resources)
+    report = []
+    for path in paths:
+        timings = {}
+        results = []
+        for name in names:
+            lexer = Lexer(spec, name)
+            tokens = lexer.tokens
+            start = time.perf_counter()
+            try:
+                output = ''.join(lexer.fragments(read_chunks(path)))
+            except Exception as error:
+                output = 'error: %s' % error
+            timings[name] = time.perf_counter() - start
+            results.append((output, tokens))
+        report.append((path, timings, all(result == results[0] for result in results)))
+    return report
+
+
+if __name__ == '__main__':
+    totals = {}
+    identical = True
+    for path, timings, same in compare_backends(sys.argv[1:]):
+        identical = identical and same
+        print(path, 'OK' if same else 'DIFFERENT',
+              ' '.join('%s=%.3fs' % (name, seconds) for name, seconds in timings.items()))
+        for name, seconds in timings.items():
+            totals[name] = totals.get(name, 0) + seconds
+    if totals:
+        print('fastest:', min(totals, key=totals.get))
+    sys.exit(0 if identical else 1)
@@ -0,0 +1,104 @@
+import argparse
+import os
+import re
+from multiprocessing import Pool
+
+from lexer import check, read_chunks, write_tables, write_tokens
+from backends import BACKENDS, Lexer
+from speccache import fresh_tokens, load_compiled, spec_tuple
+from symbols import SymbolTable
+
+SUFFIXES = ('.py', '.txt')
+CODE = re.compile(r'[A-Z]\d+')
+
+# спецификация лексера, загружается один раз в каждом процессе пула
+worker_spec = None
+
+
+def init_worker(resources):
+    global worker_spec
+    worker_spec = load_compiled(resources)
+
+
+def find_sources(root, suffixes=SUFFIXES):
+    # отсортированный список, чтобы коды лексем не зависели от порядка обхода
+    paths = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith(suffixes):
+                paths.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(paths)
+
+
+def lex_file(task):
+    # лексемы файла с локальными кодами; сам файл лексем пишется рядом
+    # с итоговым и переписывается в rewrite_file после слияния таблиц
+    source, part, backend = task
+    lexer = Lexer(worker_spec, backend)
+    os.makedirs(os.path.dirname(part), exist_ok=True)
+    write_tokens(lexer.fragments(read_chunks(source)), part)
+    return lexer.tokens
+
+
+def merge_tokens(merged, tokens):
+    """Добавляет таблицы одного файла в общие. Новые значения получают
+    коды в порядке первого появления в файле, поэтому при слиянии файлов
+    в одном и том же порядке коды совпадают с последовательным разбором
+    всех файлов с общей таблицей. Возвращает замены локальных кодов."""
+    codes = {}
+    for token_class, values in tokens.items():
+        for value, code in values.items():
+            check(merged, token_class, value)
+            if merged[token_class][value] != code:
+                codes[code] = merged[token_class][value]
+    return codes
+
+
+def rewrite_file(task):
+    part, target, codes = task
+    if codes:
+        with open(part) as read_file, open(target, 'w') as write_file:
+            for line in read_file:
+                write_file.write(CODE.sub(lambda m: codes.get(m.group(0), m.group(0)), line))
+        os.remove(part)
+    else:
+        os.replace(part, target)
+
+
+def lex_tree(root, out, backend='regex', processes=None, resources='./resources', symbols=None):
+    """Разбирает все исходные файлы каталога root в пуле процессов.
+    Для каждого файла пишет out/<путь>.tokens.txt, общие таблицы лексем -
+    в out/W.json ... out/C.json. Если передана symbols.SymbolTable, коды
+    берутся из неё, новые лексемы дописываются в её файл, а JSON-таблицы
+    не пишутся. Возвращает общие таблицы."""
+    paths = find_sources(root)
+    targets = [os.path.join(out, path + '.tokens.txt') for path in paths]
+    tasks = [(os.path.join(root, path), target + '.part', backend) for path, target in zip(paths, targets)]
+    # кэш спецификации создаётся до запуска пула, процессы его только читают
+    spec = load_compiled(resources)
+    merged = symbols.tokens if symbols is not None else fresh_tokens(spec)
+    with Pool(processes, initializer=init_worker, initargs=(resources,)) as pool:
+        rewrites = []
+        # imap отдаёт результаты в порядке файлов, как бы ни были
+        # распределены задачи между процессами
+        for task, target, tokens in zip(tasks, targets, pool.imap(lex_file, tasks)):
+            rewrites.append((task[1], target, merge_tokens(merged, tokens)))
+        pool.map(rewrite_file, rewrites)
+    if symbols is not None:
+        symbols.save()
+    else:
+        write_tables(merged, out)
+    return merged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Лексический анализ каталога с исходными текстами')
+    parser.add_argument('root')
+    parser.add_argument('out')
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    parser.add_argument('-b', '--backend', default='regex', choices=sorted(BACKENDS))
+    parser.add_argument('--resources', default='./resources')
+    parser.add_argument('--symbols', help='файл общей таблицы лексем проекта')
+    args = parser.parse_args()
+    table = SymbolTable(args.symbols, spec_tuple(load_compiled(args.resources))) if args.symbols else None
+    lex_tree(args.root, args.out, args.backend, args.jobs, args.resources, table)
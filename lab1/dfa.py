@@ -0,0 +1,271 @@
+from lexer import build_trie, check, lookahead, match, separator_token
+
+STATES = ['S', 'q1', 'q2', 'q3', 'q4', 'q5', 'q6', 'q7', 'q8', 'q9', 'q10', 'q14', 'q15', 'q16', 'Z']
+STATE_INDEX = {state: index for index, state in enumerate(STATES)}
+
+# Действия автомата. В ячейке таблицы переходов хранится
+# номер следующего состояния, сдвинутый на 4 бита, и номер действия.
+NOP, APPEND, START, TERM, FLUSH, STRING, COMMENT, LINE, INDENT, LAST = range(10)
+
+# Класс лексемы, которую выдаёт FLUSH в данном состоянии (None - служебное
+# слово, операция или идентификатор, как в семантической процедуре 1)
+FLUSH_CLASS = {'q1': None, 'q2': 'I', 'q3': 'N', 'q5': 'N', 'q8': 'N'}
+
+# Грамматика состояний q1...q16: для каждого состояния список правил
+# (предикат над свойствами символа, следующее состояние, действие).
+# Правила проверяются по порядку, как ветки if/elif в lexer.lex.
+# Предикат 'term' - "символ может завершать лексему" (операция или
+# разделитель); сама операция ищется во время разбора. Состояние None
+# означает "остаться в текущем".
+GRAMMAR = {
+    'S': [('alpha', 'q1', START), ('digit', 'q3', START), ('quote', 'q9', START), ('hash', 'q10', NOP),
+          ('term', 'S', TERM), (None, 'S', NOP)],
+    'q1': [('alpha', None, APPEND), ('digit', 'q2', APPEND), ('term', 'S', FLUSH), (None, 'S', NOP)],
+    'q2': [('alnum', None, APPEND), ('term', 'q2', FLUSH), (None, None, NOP)],
+    'q3': [('digit', None, APPEND), ('dot', 'q4', APPEND), ('e', 'q6', APPEND), ('term', 'q3', FLUSH),
+           (None, None, NOP)],
+    'q4': [('digit', 'q5', APPEND), (None, None, NOP)],
+    'q5': [('digit', None, APPEND), ('e', 'q6', APPEND), ('term', 'q5', FLUSH), (None, None, NOP)],
+    'q6': [('sign', 'q7', APPEND), ('digit', 'q8', APPEND), (None, None, NOP)],
+    'q7': [('digit', 'q8', APPEND), (None, None, NOP)],
+    'q8': [('digit', None, APPEND), ('term', 'S', FLUSH), (None, 'S', NOP)],
+    'q9': [('quote', 'S', STRING), (None, None, APPEND)],
+    'q10': [('newline', 'S', LINE), (None, 'Z', COMMENT)],
+    'q14': [('slash', 'q15', NOP), (None, None, NOP)],
+    'q15': [('newline', 'S', NOP), (None, 'Z', LAST)],
+    'q16': [('space', None, APPEND), (None, 'S', INDENT)],
+    'Z': [(None, None, NOP)],
+}
+
+
+def char_properties(symbol, operations, separators):
+    return {
+        'alpha': symbol.isalpha(),
+        'digit': symbol.isdigit(),
+        'alnum': symbol.isalnum(),
+        'quote': symbol == "'",
+        'hash': symbol == '#',
+        'space': symbol == ' ',
+        'newline': symbol == '\n',
+        'dot': symbol == '.',
+        'e': symbol == 'e' or symbol == 'E',
+        'sign': symbol == '-' or symbol == '+',
+        'slash': symbol == '/',
+        'separator': symbol in separators,
+        'opstart': any(operation.startswith(symbol) for operation in operations),
+    }
+
+
+def compile_column(dfa, properties):
+    properties['term'] = properties['separator'] or properties['opstart']
+    signature = tuple(sorted(properties.items()))
+    if signature in dfa['signatures']:
+        return dfa['signatures'][signature]
+    cls = len(dfa['signatures'])
+    dfa['signatures'][signature] = cls
+    dfa['opstart'].append(properties['opstart'])
+    for state in STATES:
+        for predicate, next_state, action in GRAMMAR[state]:
+            if predicate is None or properties[predicate]:
+                break
+        if next_state is None:
+            next_state = state
+        dfa['table'][STATE_INDEX[state]].append(STATE_INDEX[next_state] << 4 | action)
+    return cls
+
+
+def compile_dfa(service_words, operations, separators):
+    """Компилирует спецификацию лексера (key-words.json, operations.json,
+    delimeter.json) и грамматику состояний в целочисленные таблицы:
+    классы символов ASCII и таблицу переходов [состояние][класс]."""
+    dfa = {
+        'service_words': service_words,
+        'operations': operations,
+        'separators': separators,
+        'trie': build_trie(operations, separators),
+        'lookahead': lookahead(operations),
+        'signatures': {},
+        'table': [[] for _ in STATES],
+        'opstart': [],
+        'classes': [],
+        'unicode': {},
+        'special': {},
+    }
+    for code in range(128):
+        properties = char_properties(chr(code), operations, separators)
+        dfa['classes'].append(compile_column(dfa, properties))
+    # Символы вне ASCII различаются только isalpha/isdigit/isalnum, кроме
+    # тех, что есть в операциях и разделителях. Их классы тоже вычисляются
+    # здесь, чтобы после компиляции таблицы только читались и один dfa
+    # можно было использовать из нескольких потоков одновременно.
+    for alpha in (False, True):
+        for digit in (False, True):
+            for alnum in (False, True):
+                properties = char_properties('', (), ())
+                properties.update(alpha=alpha, digit=digit, alnum=alnum)
+                dfa['unicode'][alpha, digit, alnum] = compile_column(dfa, properties)
+    for value in list(operations) + list(separators):
+        for symbol in value:
+            if ord(symbol) >= 128 and symbol not in dfa['special']:
+                properties = char_properties(symbol, operations, separators)
+                dfa['special'][symbol] = compile_column(dfa, properties)
+    return dfa
+
+
+def classify(dfa, symbol):
+    # класс символа вне ASCII
+    cls = dfa['special'].get(symbol)
+    if cls is None:
+        cls = dfa['unicode'][symbol.isalpha(), symbol.isdigit(), symbol.isalnum()]
+    return cls
+
+
+def lex_table(chunks, tokens, dfa, trace=None, store=None):
+    """Табличный вариант lexer.lex: тот же автомат, но состояние и класс
+    символа - целые числа, а переход - одно обращение к таблице.
+    store - необязательный tokenstore.TokenStore, в который записываются
+    выданные лексемы с их местом в тексте и начала строк."""
+    service_words = dfa['service_words']
+    operations = dfa['operations']
+    classes = dfa['classes']
+    table = dfa['table']
+    trie = dfa['trie']
+    window = dfa['lookahead']
+    opstart = dfa['opstart']
+    flush_class = [FLUSH_CLASS.get(state) for state in STATES]
+
+    source = iter(chunks)
+    input_sequence = ''
+    length = 0
+    eof = False
+    offset = 0
+
+    i = 0
+    state = 0
+    buffer = ''
+    begin = 0
+    while True:
+        if not eof and length - i <= window:
+            input_sequence = input_sequence[i:]
+            offset += i
+            i = 0
+            for chunk in source:
+                input_sequence += chunk
+                if store is not None:
+                    store.add_text(chunk)
+                if len(input_sequence) > window:
+                    break
+            else:
+                eof = True
+            length = len(input_sequence)
+        if i >= length:
+            break
+
+        symbol = input_sequence[i]
+        code = ord(symbol)
+        cls = classes[code] if code < 128 else classify(dfa, symbol)
+        entry = table[state][cls]
+        action = entry & 15
+
+        if action == APPEND:
+            buffer += symbol
+            state = entry >> 4
+        elif action == NOP:
+            state = entry >> 4
+        elif action == START:
+            buffer = symbol
+            begin = offset + i
+            state = entry >> 4
+        elif action == FLUSH:
+            # Семантические процедуры 1-3
+            # Дерево операций нужно, только если с символа может начинаться
+            # операция, иначе символ - разделитель
+            if opstart[cls]:
+                operation, separator = match(trie, input_sequence, i)
+            else:
+                operation, separator = '', symbol
+            if operation or separator:
+                token_class = flush_class[state]
+                if token_class is None:
+                    if buffer in service_words:
+                        token_class = 'W'
+                    elif buffer in operations:
+                        token_class = 'O'
+                    else:
+                        token_class = 'I'
+                check(tokens, token_class, buffer)
+                code = tokens[token_class][buffer]
+                if store is not None:
+                    store.add(code, begin, offset + i - begin)
+                yield code + ' '
+                if operation:
+                    check(tokens, 'O', operation)
+                    if store is not None:
+                        store.add(tokens['O'][operation], offset + i, len(operation))
+                    yield tokens['O'][operation] + ' '
+                    i += len(operation) - 1
+                if separator and separator != ' ':
+                    fragment = separator_token(tokens, separator)
+                    if store is not None:
+                        store.add(tokens['R'][separator], offset + i, 1)
+                    yield fragment
+                state = 0
+            else:
+                state = entry >> 4
+        elif action == TERM:
+            # Семантические процедуры 5 и 6
+            if opstart[cls]:
+                operation, separator = match(trie, input_sequence, i)
+            else:
+                operation, separator = '', symbol
+            if operation:
+                check(tokens, 'O', operation)
+                if store is not None:
+                    store.add(tokens['O'][operation], offset + i, len(operation))
+                yield tokens['O'][operation] + ' '
+                i += len(operation) - 1
+            elif separator:
+                if separator != ' ':
+                    fragment = separator_token(tokens, separator)
+                    if store is not None:
+                        store.add(tokens['R'][separator], offset + i, 1)
+                    yield fragment
+                else:
+                    buffer = ' '
+                    begin = offset + i
+                    state = STATE_INDEX['q16']
+        elif action == STRING:
+            # Семантическая процедура 4
+            buffer += symbol
+            check(tokens, 'C', buffer)
+            if store is not None:
+                store.add(tokens['C'][buffer], begin, offset + i + 1 - begin)
+            yield tokens['C'][buffer] + ' '
+            state = 0
+        elif action == LINE:
+            yield '\n'
+            state = 0
+        elif action == COMMENT:
+            if eof and i == length - 1:
+                yield '\n'
+                state = entry >> 4
+        elif action == LAST:
+            if eof and i == length - 1:
+                state = entry >> 4
+        elif action == INDENT:
+            if len(buffer) == 1:
+                state = 0
+            elif len(buffer) % 4 != 0:
+                raise Exception('Bad tabulation')
+            else:
+                for k in range(0, len(buffer) // 4):
+                    if store is not None:
+                        store.add(tokens['R']['\t'], begin + 4 * k, 4)
+                    yield tokens['R']['\t'] + ' '
+                state = 0
+                i -= 1
+        if trace is not None:
+            trace.step(STATES[state], offset + i)
+        i += 1
+    # состояние в конце текста (значение StopIteration генератора)
+    return STATES[state]
@@ -0,0 +1,229 @@
+from lexer import match
+from dfa import APPEND, FLUSH, FLUSH_CLASS, INDENT, LINE, NOP, START, STATES, STATE_INDEX, STRING, TERM, classify
+
+# Цвета классов лексем при подсветке; 'comment' - комментарий,
+# 'error' - отступ не кратный четырём пробелам
+TAG_COLORS = {
+    'W': 'blue',
+    'I': 'black',
+    'O': 'dark orange',
+    'R': 'gray45',
+    'N': 'dark green',
+    'C': 'brown',
+    'comment': 'gray55',
+    'error': 'red',
+}
+
+# Класс незавершённой лексемы, которая переходит на следующую строку
+PENDING_CLASS = {'q4': 'N', 'q6': 'N', 'q7': 'N', 'q9': 'C', 'q10': 'comment'}
+
+START_STATE = (0, '')
+
+
+def scan_line(dfa, line, start):
+    """Разбирает одну строку (с '\\n' на конце, кроме, может быть,
+    последней) автоматом dfa начиная с состояния start = (состояние,
+    буфер). Возвращает участки (начало, конец, класс) и состояние в конце
+    строки. Коды лексем не назначаются - это нужно только для подсветки."""
+    service_words = dfa['service_words']
+    operations = dfa['operations']
+    classes = dfa['classes']
+    table = dfa['table']
+    trie = dfa['trie']
+    opstart = dfa['opstart']
+    q10 = STATE_INDEX['q10']
+
+    spans = []
+    state, buffer = start
+    begin = 0
+    i = 0
+    length = len(line)
+    while i < length:
+        symbol = line[i]
+        code = ord(symbol)
+        cls = classes[code] if code < 128 else classify(dfa, symbol)
+        entry = table[state][cls]
+        action = entry & 15
+
+        if action == APPEND:
+            buffer += symbol
+            state = entry >> 4
+        elif action == NOP:
+            if entry >> 4 == q10 and state != q10:
+                begin = i
+            state = entry >> 4
+        elif action == START:
+            buffer = symbol
+            begin = i
+            state = entry >> 4
+        elif action == FLUSH:
+            if opstart[cls]:
+                operation, separator = match(trie, line, i)
+            else:
+                operation, separator = '', symbol
+            if operation or separator:
+                token_class = FLUSH_CLASS[STATES[state]]
+                if token_class is None:
+                    if buffer in service_words:
+                        token_class = 'W'
+                    elif buffer in operations:
+                        token_class = 'O'
+                    else:
+                        token_class = 'I'
+                spans.append((begin, i, token_class))
+                if operation:
+                    spans.append((i, i + len(operation), 'O'))
+                if separator and separator != ' ':
+                    spans.append((i, i + 1, 'R'))
+                if operation:
+                    i += len(operation) - 1
+                state = 0
+            else:
+                state = entry >> 4
+        elif action == TERM:
+            if opstart[cls]:
+                operation, separator = match(trie, line, i)
+            else:
+                operation, separator = '', symbol
+            if operation:
+                spans.append((i, i + len(operation), 'O'))
+                i += len(operation) - 1
+            elif separator == ' ':
+                buffer = ' '
+                begin = i
+                state = STATE_INDEX['q16']
+            elif separator:
+                spans.append((i, i + 1, 'R'))
+        elif action == STRING:
+            spans.append((begin, i + 1, 'C'))
+            state = 0
+        elif action == LINE:
+            spans.append((begin, i, 'comment'))
+            state = 0
+        elif action == INDENT:
+            state = 0
+            if len(buffer) > 1:
+                if len(buffer) % 4 != 0:
+                    spans.append((begin, i, 'error'))
+                i -= 1
+        i += 1
+    pending = PENDING_CLASS.get(STATES[state])
+    if pending and begin < length:
+        spans.append((begin, length, pending))
+    return spans, (state, buffer)
+
+
+class IncrementalLexer:
+    """Разбор текста по строкам с запоминанием состояния автомата в
+    начале каждой строки. После правки строки разбираются заново только
+    с изменённой и до той, на которой состояние снова совпало с прежним."""
+
+    def __init__(self, dfa):
+        self.dfa = dfa
+        self.lines = []
+        self.spans = []
+        # starts[k] - состояние в начале строки k, starts[len(lines)] - в конце текста
+        self.starts = [START_STATE]
+
+    def set_text(self, lines):
+        self.lines = []
+        self.spans = []
+        self.starts = [START_STATE]
+        return self.replace(0, 0, lines)
+
+    def replace(self, first, count, new_lines):
+        """Заменяет строки first...first+count-1 на new_lines. Возвращает
+        (first, last): строки first...last-1 разобраны заново."""
+        self.lines[first:first + count] = new_lines
+        self.spans[first:first + count] = [None] * len(new_lines)
+        self.starts[first + 1:first + count + 1] = [None] * len(new_lines)
+        line = first
+        while line < len(self.lines):
+            self.spans[line], end = scan_line(self.dfa, self.lines[line], self.starts[line])
+            line += 1
+            if line >= first + len(new_lines) and self.starts[line] == end:
+                break
+            self.starts[line] = end
+        return first, line
+
+
+class Highlighter:
+    """Подсветка классов лексем в tkinter.Text по мере набора. Вставки и
+    удаления перехватываются на уровне команды виджета, поэтому известно,
+    какие строки изменились, и перекрашиваются только они."""
+
+    def __init__(self, text, dfa):
+        self.text = text
+        self.lexer = IncrementalLexer(dfa)
+        for tag, color in TAG_COLORS.items():
+            text.tag_configure(tag, foreground=color)
+        # команда виджета в Tcl переименовывается, а под её именем
+        # регистрируется dispatch (как idlelib.redirector, которого может не
+        # быть: IDLE в некоторых дистрибутивах ставится отдельно)
+        self.widget = str(text)
+        self.original = self.widget + '_original'
+        text.tk.call('rename', self.widget, self.original)
+        text.tk.createcommand(self.widget, self.dispatch)
+        self.paint(*self.lexer.set_text(self.get_lines(1, self.line_count())))
+
+    def dispatch(self, operation, *args):
+        # все команды виджета, в том числе вставки и удаления с клавиатуры
+        from tkinter import TclError
+
+        try:
+            if operation == 'insert':
+                return self.on_insert(*args)
+            if operation == 'delete':
+                return self.on_delete(*args)
+            return self.call(operation, *args)
+        except TclError:
+            # как в idlelib.redirector: ошибка Tcl (например, вставка в
+            # отключённый виджет) не прерывает обработку события
+            return ''
+
+    def call(self, operation, *args):
+        # команда исходного виджета, в обход подсветки
+        return self.text.tk.call((self.original, operation) + args)
+
+    def insert(self, *args):
+        return self.call('insert', *args)
+
+    def delete(self, *args):
+        return self.call('delete', *args)
+
+    def line_count(self):
+        return int(self.text.index('end-1c').split('.')[0])
+
+    def line_of(self, index):
+        return int(self.text.index(index).split('.')[0])
+
+    def get_lines(self, first, last):
+        # строки first...last виджета (нумерация tkinter - с единицы)
+        return [self.text.get('%d.0' % n, '%d.end' % n) + '\n' for n in range(first, last + 1)]
+
+    def on_insert(self, index, chars, *args):
+        # 'end' - строка после последней, но вставка попадает в последнюю
+        first = min(self.line_of(index), self.line_count())
+        self.insert(index, chars, *args)
+        added = chars.count('\n') + sum(part.count('\n') for part in args[1::2])
+        self.update(first, 1, added + 1)
+
+    def on_delete(self, index1, index2=None):
+        first = self.line_of(index1)
+        last = self.line_of(index2 if index2 is not None else index1 + '+1c')
+        last = min(last, self.line_count())
+        self.delete(index1, index2)
+        self.update(first, last - first + 1, 1)
+
+    def update(self, first, old_count, new_count):
+        new_count = min(new_count, self.line_count() - first + 1)
+        lines = self.get_lines(first, first + new_count - 1)
+        self.paint(*self.lexer.replace(first - 1, old_count, lines))
+
+    def paint(self, first, last):
+        for line in range(first, last):
+            start, end = '%d.0' % (line + 1), '%d.end' % (line + 1)
+            for tag in TAG_COLORS:
+                self.text.tag_remove(tag, start, end)
+            for begin, finish, tag in self.lexer.spans[line]:
+                self.text.tag_add(tag, '%d.%d' % (line + 1, begin), '%d.%d' % (line + 1, finish))
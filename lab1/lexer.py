@@ -0,0 +1,321 @@
+import json
+import os
+
+CHUNK_SIZE = 1 << 16
+SPEC_FILES = ('key-words.json', 'operations.json', 'delimeter.json')
+
+
+def check(tokens, token_class, token_value):
+    if not (token_value in tokens[token_class]):
+        token_code = str(len(tokens[token_class]) + 1)
+        tokens[token_class][token_value] = token_class + token_code
+
+
+def load_spec(resources='./resources'):
+    """Служебные слова, операции и разделители из JSON-файлов спецификации
+    (словари в порядке файлов; важны только ключи)."""
+    spec = []
+    for name in SPEC_FILES:
+        with open(os.path.join(resources, name)) as f:
+            spec.append(json.loads(f.read()))
+    return tuple(spec)
+
+
+def new_tokens(service_words, operations, separators):
+    tokens = {'W': {}, 'I': {}, 'O': {}, 'R': {}, 'N': {}, 'C': {}}
+    for key in service_words:
+        check(tokens, 'W', key)
+    for key in operations:
+        check(tokens, 'O', key)
+    for key in separators:
+        check(tokens, 'R', key)
+    return tokens
+
+
+def build_trie(operations, separators):
+    """Префиксное дерево операций и разделителей. Узел - словарь
+    {символ: узел}, под ключом '' хранятся классы лексем ('O' и/или 'R'),
+    которые заканчиваются в этом узле."""
+    trie = {}
+    for token_class, values in (('O', operations), ('R', separators)):
+        for value in values:
+            node = trie
+            for symbol in value:
+                node = node.setdefault(symbol, {})
+            node[''] = node.get('', '') + token_class
+    return trie
+
+
+def lookahead(operations):
+    # сколько символов после текущего нужно видеть, чтобы найти самую
+    # длинную операцию (операция не может стоять последним символом текста)
+    return max(len(operation) for operation in operations) + 1
+
+
+def match(trie, input_sequence, i):
+    """Самая длинная операция, начинающаяся в позиции i, и разделитель
+    в позиции i. Вместо отсутствующих возвращается ''."""
+    operation = separator = ''
+    node = trie.get(input_sequence[i])
+    if node is None:
+        return operation, separator
+    if 'R' in node.get('', ''):
+        separator = input_sequence[i]
+    end = len(input_sequence)
+    j = i + 1
+    while j < end:
+        if 'O' in node.get('', ''):
+            operation = input_sequence[i:j]
+        node = node.get(input_sequence[j])
+        if node is None:
+            break
+        j += 1
+    return operation, separator
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'r') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def write_tokens(fragments, path):
+    with open(path, 'w') as f:
+        f.writelines(fragments)
+
+
+def code_table(values):
+    # таблица одного класса в обратную сторону: код -> значение
+    return {code: value for value, code in values.items()}
+
+
+def write_tables(tokens, directory):
+    # таблицы лексем: по файлу на класс, код -> значение
+    for token_class in tokens.keys():
+        with open(os.path.join(directory, '%s.json' % token_class), 'w') as write_file:
+            json.dump(code_table(tokens[token_class]), write_file, indent=4, ensure_ascii=False)
+
+
+def separator_token(tokens, separator):
+    check(tokens, 'R', separator)
+    if separator == '\n':
+        return tokens['R'][separator] + '\n'
+    return tokens['R'][separator] + ' '
+
+
+def lex(chunks, tokens, service_words, operations, separators, trace=None):
+    """Генератор лексем: читает исходный текст по частям из chunks и
+    выдаёт фрагменты выходной последовательности (в формате tokens.txt)
+    по мере разбора. В памяти держится только текущее окно текста.
+    trace - необязательный tracing.Trace для счётчиков по состояниям."""
+    trie = build_trie(operations, separators)
+    window = lookahead(operations)
+    source = iter(chunks)
+    input_sequence = ''
+    eof = False
+    offset = 0
+
+    i = 0
+    state = 'S'
+    buffer = ''
+    while True:
+        # Подгружаем следующую часть, когда до конца окна осталось меньше,
+        # чем нужно для просмотра вперёд в match
+        if not eof and len(input_sequence) - i <= window:
+            input_sequence = input_sequence[i:]
+            offset += i
+            i = 0
+            for chunk in source:
+                input_sequence += chunk
+                if len(input_sequence) > window:
+                    break
+            else:
+                eof = True
+        if i >= len(input_sequence):
+            break
+        last = eof and i == len(input_sequence) - 1
+
+        symbol = input_sequence[i]
+        if state == 'S':
+            buffer = ''
+            if symbol.isalpha():
+                state = 'q1'
+                buffer += symbol
+            elif symbol.isdigit():
+                state = 'q3'
+                buffer += symbol
+            elif symbol == "'":
+                state = 'q9'
+                buffer += symbol
+            elif symbol == '#':
+                state = 'q10'
+            else:
+                operation, separator = match(trie, input_sequence, i)
+                if operation:
+                    # Семантическая процедура 5
+                    check(tokens, 'O', operation)
+                    yield tokens['O'][operation] + ' '
+                    i += len(operation) - 1
+                elif separator:
+                    # Семантическая процедура 6
+                    if separator != ' ':
+                        yield separator_token(tokens, separator)
+                    else:
+                        buffer = ' '
+                        state = 'q16'
+                elif last:
+                    state = 'Z'
+        elif state == 'q1':
+            if symbol.isalpha():
+                buffer += symbol
+            elif symbol.isdigit():
+                state = 'q2'
+                buffer += symbol
+            else:
+                # Семантическая процедура 1
+                operation, separator = match(trie, input_sequence, i)
+                if operation or separator:
+                    if buffer in service_words:
+                        yield tokens['W'][buffer] + ' '
+                    elif buffer in operations:
+                        yield tokens['O'][buffer] + ' '
+                    else:
+                        check(tokens, 'I', buffer)
+                        yield tokens['I'][buffer] + ' '
+                    if operation:
+                        check(tokens, 'O', operation)
+                        yield tokens['O'][operation] + ' '
+                        i += len(operation) - 1
+                    if separator and separator != ' ':
+                        yield separator_token(tokens, separator)
+                state = 'S'
+        elif state == 'q2':
+            if symbol.isalnum():
+                buffer += symbol
+            else:
+                # Семантическая процедура 2
+                operation, separator = match(trie, input_sequence, i)
+                if operation or separator:
+                    check(tokens, 'I', buffer)
+                    yield tokens['I'][buffer] + ' '
+                    if operation:
+                        check(tokens, 'O', operation)
+                        yield tokens['O'][operation] + ' '
+                        i += len(operation) - 1
+                    if separator and separator != ' ':
+                        yield separator_token(tokens, separator)
+                    state = 'S'
+        elif state == 'q3':
+            if symbol.isdigit():
+                buffer += symbol
+            elif symbol == '.':
+                state = 'q4'
+                buffer += symbol
+            elif symbol == 'e' or symbol == 'E':
+                state = 'q6'
+                buffer += symbol
+            else:
+                operation, separator = match(trie, input_sequence, i)
+                if operation or separator:
+                    check(tokens, 'N', buffer)
+                    yield tokens['N'][buffer] + ' '
+                    if operation:
+                        check(tokens, 'O', operation)
+                        yield tokens['O'][operation] + ' '
+                        i += len(operation) - 1
+                    if separator and separator != ' ':
+                        yield separator_token(tokens, separator)
+                    state = 'S'
+        elif state == 'q4':
+            if symbol.isdigit():
+                state = 'q5'
+                buffer += symbol
+        elif state == 'q5':
+            if symbol.isdigit():
+                buffer += symbol
+            elif symbol == 'e' or symbol == 'E':
+                state = 'q6'
+                buffer += symbol
+            else:
+                operation, separator = match(trie, input_sequence, i)
+                if operation or separator:
+                    check(tokens, 'N', buffer)
+                    yield tokens['N'][buffer] + ' '
+                    if operation:
+                        check(tokens, 'O', operation)
+                        yield tokens['O'][operation] + ' '
+                        i += len(operation) - 1
+                    if separator and separator != ' ':
+                        yield separator_token(tokens, separator)
+                    state = 'S'
+        elif state == 'q6':
+            if symbol == '-' or symbol == '+':
+                state = 'q7'
+                buffer += symbol
+            elif symbol.isdigit():
+                state = 'q8'
+                buffer += symbol
+        elif state == 'q7':
+            if symbol.isdigit():
+                state = 'q8'
+                buffer += symbol
+        elif state == 'q8':
+            if symbol.isdigit():
+                buffer += symbol
+            else:
+                # Семантическая операция 3
+                operation, separator = match(trie, input_sequence, i)
+                if operation or separator:
+                    check(tokens, 'N', buffer)
+                    yield tokens['N'][buffer] + ' '
+                    if operation:
+                        check(tokens, 'O', operation)
+                        yield tokens['O'][operation] + ' '
+                        i += len(operation) - 1
+                    if separator and separator != ' ':
+                        yield separator_token(tokens, separator)
+                state = 'S'
+        elif state == 'q9':
+            if symbol != "'":
+                buffer += symbol
+            elif symbol == "'":
+                # Семантическая процедура 4
+                buffer += symbol
+                check(tokens, 'C', buffer)
+                yield tokens['C'][buffer] + ' '
+                state = 'S'
+        elif state == 'q10':
+            if symbol == '\n':
+                yield '\n'
+                state = 'S'
+            elif last:
+                yield '\n'
+                state = 'Z'
+        elif state == 'q14':
+            if symbol == '/':
+                state = 'q15'
+        elif state == 'q15':
+            if symbol == '\n':
+                state = 'S'
+            elif last:
+                state = 'Z'
+        elif state == 'q16':
+            if symbol == ' ':
+                buffer += ' '
+            elif len(buffer) == 1:
+                state = 'S'
+            elif len(buffer) % 4 != 0:
+                raise Exception('Bad tabulation')
+            else:
+                for k in range(0, len(buffer) // 4):
+                    yield tokens['R']['\t'] + ' '
+                state = 'S'
+                i -= 1
+        if trace is not None:
+            trace.step(state, offset + i)
+        i += 1
+    # состояние в конце текста (значение StopIteration генератора)
+    return state
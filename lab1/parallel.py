@@ -0,0 +1,132 @@
+import argparse
+import io
+import os
+from multiprocessing import Pool
+
+import batch
+from backends import TRACEABLE, Lexer
+from batch import CODE, init_worker, merge_tokens
+from lexer import write_tables, write_tokens
+from speccache import fresh_tokens, load_compiled
+
+# Параллельный разбор одного большого файла. Файл делится на части по
+# границам строк, части разбираются в пуле процессов, каждая - с начального
+# состояния S и своими таблицами лексем. Граница подходит, если
+# последовательный лексер после её '\n' тоже оказался бы в S; это почти
+# всегда так, кроме многострочных констант q9 и недописанных чисел q4, q6,
+# q7. Поэтому каждая часть сообщает своё конечное состояние, и если оно не S,
+# эта часть и следующая разбираются заново одним куском. Таблицы частей
+# сливаются по порядку, как в batch.merge_tokens, так что коды I, N и C
+# совпадают с последовательным разбором.
+
+
+def split_points(path, parts):
+    # смещения (в байтах) сразу после '\n', делящие файл примерно поровну
+    size = os.path.getsize(path)
+    points = [0]
+    with open(path, 'rb') as f:
+        for k in range(1, parts):
+            target = size * k // parts
+            if target <= points[-1]:
+                continue
+            f.seek(target)
+            line = f.readline()
+            point = target + len(line)
+            if line.endswith(b'\n') and points[-1] < point < size:
+                points.append(point)
+    points.append(size)
+    return points
+
+
+def read_part(path, start, end):
+    # кусок файла как текст - с той же кодировкой и обработкой переводов
+    # строк, что и у open(path, 'r') в lexer.read_chunks
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return io.TextIOWrapper(io.BytesIO(data)).read()
+
+
+def lex_part(spec, text, backend):
+    """Разбирает кусок текста с состояния S. Возвращает (tokens.txt куска,
+    таблицы куска, состояние в конце, исключение лексера или None)."""
+    lexer = Lexer(spec, backend)
+    final = []
+
+    def fragments():
+        final.append((yield from lexer.fragments((text,))))
+
+    try:
+        output = ''.join(fragments())
+    except Exception as error:
+        return '', lexer.tokens, None, error
+    return output, lexer.tokens, final[0], None
+
+
+def lex_segment(task):
+    path, start, end, backend = task
+    return lex_part(batch.worker_spec, read_part(path, start, end), backend)
+
+
+def parallel_fragments(path, tokens, backend='table', processes=None, resources='./resources', parts=None):
+    """Генератор фрагментов tokens.txt файла path, совпадающих с
+    последовательным разбором. tokens - общие таблицы лексем, которые
+    дополняются по ходу (как у Lexer). Лексер должен быть из TRACEABLE:
+    только они сообщают конечное состояние."""
+    if backend not in TRACEABLE:
+        raise ValueError('backend %s does not report its final state' % backend)
+    spec = load_compiled(resources)
+    if processes is None:
+        processes = os.cpu_count()
+    if any('\n' in operation for operation in spec.operations):
+        # операция может продолжиться за границей строки
+        points = [0, os.path.getsize(path)]
+    else:
+        points = split_points(path, parts or processes * 4)
+    segments = list(zip(points, points[1:]))
+
+    with Pool(processes, initializer=init_worker, initargs=(resources,)) as pool:
+        results = pool.imap(lex_segment, [(path, start, end, backend) for start, end in segments])
+        # pending - последний разобранный кусок, начало которого проверено:
+        # его можно выдавать, только когда известно, что он кончился в S
+        pending = None
+        for (start, end), result in zip(segments, results):
+            if pending is not None:
+                pending_start, (output, part_tokens, state, error) = pending
+                if error is not None:
+                    raise error
+                if state == 'S':
+                    yield convert(tokens, output, part_tokens)
+                else:
+                    text = read_part(path, pending_start, end)
+                    pending = pending_start, lex_part(spec, text, backend)
+                    continue
+            pending = start, result
+        if pending is not None:
+            output, part_tokens, state, error = pending[1]
+            if error is not None:
+                raise error
+            yield convert(tokens, output, part_tokens)
+
+
+def convert(tokens, output, part_tokens):
+    # tokens.txt куска с кодами общих таблиц
+    codes = merge_tokens(tokens, part_tokens)
+    if not codes:
+        return output
+    return CODE.sub(lambda m: codes.get(m.group(0), m.group(0)), output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Параллельный лексический анализ одного файла')
+    parser.add_argument('source')
+    parser.add_argument('out')
+    parser.add_argument('-j', '--jobs', type=int, default=None)
+    parser.add_argument('-b', '--backend', default='table', choices=sorted(TRACEABLE))
+    parser.add_argument('--resources', default='./resources')
+    args = parser.parse_args()
+    merged = fresh_tokens(load_compiled(args.resources))
+    os.makedirs(args.out, exist_ok=True)
+    write_tokens(parallel_fragments(args.source, merged, args.backend, args.jobs, args.resources),
+                 os.path.join(args.out, 'tokens.txt'))
+    write_tables(merged, args.out)
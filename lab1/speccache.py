@@ -0,0 +1,84 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import namedtuple
+
+from lexer import SPEC_FILES, load_spec, new_tokens
+from dfa import compile_dfa
+
+# кэш лежит в каталоге gen рядом с каталогом спецификации (для
+# ./resources - ./gen/spec.cache), а не относительно текущего каталога
+CACHE_NAME = 'spec.cache'
+# меняется при изменении состава скомпилированной спецификации,
+# чтобы старый кэш не подошёл новой версии кода
+CACHE_VERSION = 2
+
+
+def spec_hash(resources='./resources'):
+    digest = hashlib.sha256(b'%d' % CACHE_VERSION)
+    for name in SPEC_FILES:
+        with open(os.path.join(resources, name), 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+# Скомпилированная спецификация лексера: служебные слова, операции и
+# разделители, начальные таблицы лексем (W, O, R уже заполнены) и таблицы
+# автомата dfa.compile_dfa. После компиляции она только читается, поэтому
+# одну спецификацию можно разделять между потоками и прогонами лексера.
+CompiledSpec = namedtuple('CompiledSpec', 'service_words operations separators tokens dfa')
+
+
+def compile_spec(resources='./resources'):
+    service_words, operations, separators = load_spec(resources)
+    return CompiledSpec(
+        service_words,
+        operations,
+        separators,
+        new_tokens(service_words, operations, separators),
+        compile_dfa(service_words, operations, separators),
+    )
+
+
+def cache_path(resources='./resources'):
+    return os.path.join(os.path.dirname(os.path.abspath(resources)), 'gen', CACHE_NAME)
+
+
+def load_compiled(resources='./resources', cache=None):
+    """compile_spec через кэш: результат хранится в файле cache вместе с
+    хешем содержимого файлов спецификации и читается одним pickle.load.
+    Если хотя бы один файл спецификации изменился, хеш не совпадёт и
+    спецификация будет скомпилирована и сохранена заново. По умолчанию
+    cache - cache_path(resources)."""
+    if cache is None:
+        cache = cache_path(resources)
+    key = spec_hash(resources)
+    try:
+        with open(cache, 'rb') as f:
+            cached_key, spec = pickle.load(f)
+        if cached_key == key:
+            return spec
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    spec = compile_spec(resources)
+    directory = os.path.dirname(cache)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # пишем во временный файл, чтобы параллельные запуски не прочитали
+    # недописанный кэш
+    temporary = '%s.%d.%d' % (cache, os.getpid(), threading.get_ident())
+    with open(temporary, 'wb') as f:
+        pickle.dump((key, spec), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, cache)
+    return spec
+
+
+def spec_tuple(spec):
+    return spec.service_words, spec.operations, spec.separators
+
+
+def fresh_tokens(spec):
+    # копия начальных таблиц для одного прогона лексера
+    return {token_class: dict(values) for token_class, values in spec.tokens.items()}
@@ -0,0 +1,63 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Замер времени запуска транслятора без окна. main импортируют процессы
+# пула, пакетные прогоны и командная строка, поэтому окно (tkinter), пул
+# процессов и сетевой переводчик (translate) подгружаются только тогда,
+# когда нужны. measure запускает новый интерпретатор и замеряет импорт
+# модуля в нём; HEAVY_MODULES не должны при этом загружаться.
+# Бюджет задан не в миллисекундах, а в долях запуска пустого
+# интерпретатора, замеренного в том же прогоне: так он не зависит от
+# скорости машины.
+STARTUP_BUDGET = 2.5
+HEAVY_MODULES = ('tkinter', 'translate', 'multiprocessing.pool')
+RUNS = 7
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+print(' '.join(sys.modules))
+'''
+
+
+def measure(module, runs=RUNS, directory=os.path.dirname(os.path.abspath(__file__))):
+    """Медиана времени импорта module в новом интерпретаторе (мс), медиана
+    времени запуска пустого интерпретатора (мс) и загруженные при импорте
+    модули из HEAVY_MODULES."""
+    timings = []
+    baselines = []
+    heavy = set()
+    for _ in range(runs):
+        # пустой интерпретатор запускается вперемешку с замерами импорта,
+        # чтобы оба числа застали одну и ту же загрузку машины
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], cwd=directory, check=True)
+        baselines.append((time.perf_counter() - start) * 1000)
+        output = subprocess.run([sys.executable, '-c', PROBE % module], cwd=directory, check=True,
+                                capture_output=True, text=True).stdout.split('\n')
+        timings.append(float(output[0]) * 1000)
+        heavy.update(set(output[1].split()) & set(HEAVY_MODULES))
+    return statistics.median(timings), statistics.median(baselines), sorted(heavy)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Время импорта модулей транслятора без окна')
+    parser.add_argument('modules', nargs='*', default=['main'])
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET, metavar='X',
+                        help='допустимое время импорта в запусках пустого интерпретатора')
+    parser.add_argument('--runs', type=int, default=RUNS)
+    args = parser.parse_args()
+    fits = True
+    for module in args.modules:
+        milliseconds, baseline, heavy = measure(module, args.runs)
+        fits = fits and milliseconds <= args.budget * baseline and not heavy
+        print('%s: %.1f мс, пустой интерпретатор %.1f мс (бюджет %.1f× = %.1f мс)%s'
+              % (module, milliseconds, baseline, args.budget, args.budget * baseline,
+                 ', загружены ' + ' '.join(heavy) if heavy else ''))
+    sys.exit(0 if fits else 1)
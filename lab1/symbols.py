@@ -0,0 +1,77 @@
+import json
+import os
+
+from lexer import check
+
+TOKEN_CLASSES = ('W', 'I', 'O', 'R', 'N', 'C')
+
+
+class SymbolClass(dict):
+    """Таблица одного класса лексем: значение -> код, как tokens[класс],
+    плюс список values для обратного поиска (код Ik - values[k - 1]).
+    Новые значения запоминаются в pending до сохранения."""
+
+    def __init__(self, token_class):
+        super().__init__()
+        self.token_class = token_class
+        self.values = []
+        self.pending = []
+
+    def __setitem__(self, value, code):
+        super().__setitem__(value, code)
+        self.values.append(value)
+        self.pending.append(value)
+
+
+class SymbolTable:
+    """Общая для проекта таблица лексем, которая хранится между запусками
+    в файле path (по строке JSON ["класс", значение] на каждое значение,
+    в порядке назначения кодов). Файл читается один раз при создании, а
+    save дописывает в него только новые значения, поэтому коды одних и тех
+    же лексем не меняются от запуска к запуску и от файла к файлу.
+
+    spec - (служебные слова, операции, разделители), как speccache.spec_tuple:
+    лексеры ищут коды W, O и R в таблицах, не добавляя их, поэтому без
+    спецификации таблицу нельзя передать лексеру.
+
+    tokens - словарь таблиц в том же виде, что и у lexer.new_tokens, его
+    можно передавать любому лексеру."""
+
+    def __init__(self, path, spec):
+        self.path = path
+        self.tokens = {token_class: SymbolClass(token_class) for token_class in TOKEN_CLASSES}
+        if os.path.exists(path):
+            with open(path) as read_file:
+                for line in read_file:
+                    token_class, value = json.loads(line)
+                    check(self.tokens, token_class, value)
+            # прочитанное из файла в нём уже есть
+            for symbols in self.tokens.values():
+                symbols.pending = []
+        # служебные слова, операции и разделители спецификации, которых ещё
+        # нет в файле, остаются в pending и дописываются первым же save
+        service_words, operations, separators = spec
+        for key in service_words:
+            check(self.tokens, 'W', key)
+        for key in operations:
+            check(self.tokens, 'O', key)
+        for key in separators:
+            check(self.tokens, 'R', key)
+
+    def code(self, token_class, value):
+        return self.tokens[token_class].get(value)
+
+    def value(self, code):
+        return self.tokens[code[0]].values[int(code[1:]) - 1]
+
+    def save(self):
+        # коды назначаются по порядку, так что дописывать можно в любом
+        # порядке классов: при чтении каждое значение получит тот же код
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as write_file:
+            for symbols in self.tokens.values():
+                for value in symbols.pending:
+                    write_file.write(json.dumps([symbols.token_class, value], ensure_ascii=False) + '\n')
+                symbols.pending = []
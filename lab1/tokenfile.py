@@ -0,0 +1,177 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from symbols import TOKEN_CLASSES
+from tokenstore import CLASS_INDEX
+
+# Двоичный файл лексем:
+#   MAGIC, длина заголовка (uint32 LE), заголовок - JSON в UTF-8, дополненный
+#   пробелами до границы 4 байт;
+#   таблицы лексем: для каждого класса из заголовка значения в порядке кодов,
+#   каждое - длина в байтах (varint) и UTF-8;
+#   выравнивание нулями до 4 байт;
+#   поток лексем - по uint32 LE на лексему: класс << INDEX_BITS | номер;
+#   если в заголовке positions, следом два таких же массива: начала и длины.
+MAGIC = b'LXB1'
+INDEX_BITS = 28
+INDEX_MASK = (1 << INDEX_BITS) - 1
+HEADER = struct.Struct('<4sI')
+
+
+def encode_varint(number, out):
+    while number >= 0x80:
+        out.append(number & 0x7f | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def decode_varint(data, position):
+    number = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, position
+        shift += 7
+
+
+def text_codes(output):
+    # коды из текста tokens.txt
+    for code in output.split():
+        yield CLASS_INDEX[code[0]], int(code[1:])
+
+
+def little_endian(values):
+    if sys.byteorder != 'little':
+        values = array('I', values)
+        values.byteswap()
+    return values
+
+
+def write_binary(path, tokens, codes, store=None):
+    """Пишет двоичный файл лексем: таблицы tokens (значение -> код) и поток
+    codes - пары (номер класса в TOKEN_CLASSES, номер в таблице). Если
+    передан tokenstore.TokenStore, из него берутся и коды, и места лексем."""
+    if any(len(values) > INDEX_MASK for values in tokens.values()):
+        raise ValueError('token table is too large for the binary format')
+    if store is not None:
+        stream = array('I', (cls << INDEX_BITS | index for cls, index in zip(store.classes, store.indexes)))
+    else:
+        stream = array('I', (cls << INDEX_BITS | index for cls, index in codes))
+    header = json.dumps({
+        'classes': list(tokens),
+        'sizes': [len(values) for values in tokens.values()],
+        'count': len(stream),
+        'positions': store is not None,
+    }).encode()
+    header += b' ' * (-len(header) % 4)
+
+    body = bytearray()
+    for values in tokens.values():
+        for value in values:
+            data = value.encode()
+            encode_varint(len(data), body)
+            body += data
+    body += b'\0' * (-(HEADER.size + len(header) + len(body)) % 4)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(header)))
+        f.write(header)
+        f.write(body)
+        little_endian(stream).tofile(f)
+        if store is not None:
+            little_endian(store.starts).tofile(f)
+            little_endian(store.lengths).tofile(f)
+
+
+class TokenFile:
+    """Чтение двоичного файла лексем через mmap. Поток лексем не копируется
+    и не разбирается заранее: stream - memoryview на uint32 прямо в файле,
+    итерация выдаёт пары целых (номер класса, номер в таблице) без строк."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError('%s is not a binary token file' % path)
+        position = HEADER.size + header_length
+        header = json.loads(bytes(self.map[HEADER.size:position]))
+        self.classes = [CLASS_INDEX[token_class] for token_class in header['classes']]
+        self.count = header['count']
+
+        # значения таблиц: values[номер класса][номер - 1]
+        self.values = [[] for _ in TOKEN_CLASSES]
+        for cls, size in zip(self.classes, header['sizes']):
+            values = self.values[cls]
+            for _ in range(size):
+                length, position = decode_varint(self.map, position)
+                values.append(str(self.map[position:position + length], 'utf-8'))
+                position += length
+        position += -position % 4
+
+        self.view = memoryview(self.map)
+        self.stream = self.column(position)
+        if header['positions']:
+            self.starts = self.column(position + 4 * self.count)
+            self.lengths = self.column(position + 8 * self.count)
+        else:
+            self.starts = self.lengths = None
+
+    def column(self, position):
+        column = self.view[position:position + 4 * self.count].cast('I')
+        if sys.byteorder != 'little':
+            column = array('I', column)
+            column.byteswap()
+        return column
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for packed in self.stream:
+            yield packed >> INDEX_BITS, packed & INDEX_MASK
+
+    def code(self, k):
+        packed = self.stream[k]
+        return TOKEN_CLASSES[packed >> INDEX_BITS] + str(packed & INDEX_MASK)
+
+    def value(self, k):
+        packed = self.stream[k]
+        return self.values[packed >> INDEX_BITS][(packed & INDEX_MASK) - 1]
+
+    def text(self):
+        """Поток лексем в текстовом виде tokens.txt (без пустых строк на
+        месте комментариев: в двоичном файле комментариев нет)."""
+        newline = CLASS_INDEX['R'], self.values[CLASS_INDEX['R']].index('\n') + 1 \
+            if '\n' in self.values[CLASS_INDEX['R']] else None
+        return ''.join(self.code(k) + ('\n' if token == newline else ' ') for k, token in enumerate(self))
+
+    def tokens(self):
+        # таблицы в том же виде, что и у лексера: значение -> код
+        return {TOKEN_CLASSES[cls]: {value: TOKEN_CLASSES[cls] + str(k + 1)
+                                     for k, value in enumerate(self.values[cls])}
+                for cls in self.classes}
+
+    def close(self):
+        # memoryview на mmap нужно освободить до закрытия отображения
+        for column in (self.stream, self.starts, self.lengths, self.view):
+            if isinstance(column, memoryview):
+                column.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == '__main__':
+    with TokenFile(sys.argv[1]) as token_file:
+        sys.stdout.write(token_file.text())
@@ -0,0 +1,72 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+from symbols import TOKEN_CLASSES
+
+CLASS_INDEX = {token_class: index for index, token_class in enumerate(TOKEN_CLASSES)}
+
+
+class TokenStore:
+    """Лексемы текста в четырёх параллельных массивах array('I'): класс
+    (номер в TOKEN_CLASSES), номер в таблице класса, смещение начала в
+    тексте и длина. line_starts - смещения начал строк. Лексема занимает
+    четыре числа, а не объект или строку, поэтому в памяти помещаются
+    лексемы миллионов строк; поиск по позиции - двоичный, за O(log n).
+
+    Заполняется лексером (dfa.lex_table, backends.Lexer с store)."""
+
+    def __init__(self):
+        self.classes = array('I')
+        self.indexes = array('I')
+        self.starts = array('I')
+        self.lengths = array('I')
+        self.line_starts = array('I', [0])
+        self.size = 0
+
+    def add(self, code, start, length):
+        self.classes.append(CLASS_INDEX[code[0]])
+        self.indexes.append(int(code[1:]))
+        self.starts.append(start)
+        self.lengths.append(length)
+
+    def add_text(self, chunk):
+        # очередная часть текста: запоминаем, где в ней начинаются строки
+        position = chunk.find('\n')
+        while position != -1:
+            self.line_starts.append(self.size + position + 1)
+            position = chunk.find('\n', position + 1)
+        self.size += len(chunk)
+
+    def __len__(self):
+        return len(self.classes)
+
+    def code(self, k):
+        return TOKEN_CLASSES[self.classes[k]] + str(self.indexes[k])
+
+    def span(self, k):
+        return self.starts[k], self.starts[k] + self.lengths[k]
+
+    def token_at(self, position):
+        """Номер лексемы, которая занимает символ в позиции position,
+        или None, если символ не входит ни в одну лексему."""
+        k = bisect_right(self.starts, position) - 1
+        if k >= 0 and position < self.starts[k] + self.lengths[k]:
+            return k
+        return None
+
+    def line_of(self, position):
+        # номер строки (с нуля), в которой стоит символ position
+        return bisect_right(self.line_starts, position) - 1
+
+    def line_column(self, position):
+        line = self.line_of(position)
+        return line, position - self.line_starts[line]
+
+    def position(self, line, column):
+        return self.line_starts[line] + column
+
+    def line_tokens(self, line):
+        """Номера лексем, которые начинаются в строке line."""
+        start = self.line_starts[line]
+        end = self.line_starts[line + 1] if line + 1 < len(self.line_starts) else self.size
+        return range(bisect_left(self.starts, start), bisect_left(self.starts, end))
@@ -0,0 +1,46 @@
+import json
+import time
+from collections import deque
+
+
+class Trace:
+    """Счётчики работы автомата лексера: сколько символов обработано в
+    каждом состоянии, сколько времени на это ушло, гистограмма переходов
+    и (если задан history) последние history переходов.
+
+    Лексеры вызывают step только когда им передан объект Trace, поэтому
+    без трассировки разбор ничего не платит."""
+
+    def __init__(self, history=0):
+        self.visits = {}
+        self.seconds = {}
+        self.transitions = {}
+        self.history = deque(maxlen=history) if history else None
+        self.state = 'S'
+        self.last = time.perf_counter()
+
+    def step(self, state, position):
+        # символ в позиции position обработан в состоянии self.state,
+        # автомат перешёл в state
+        now = time.perf_counter()
+        previous = self.state
+        self.visits[previous] = self.visits.get(previous, 0) + 1
+        self.seconds[previous] = self.seconds.get(previous, 0) + now - self.last
+        transition = previous + '->' + state
+        self.transitions[transition] = self.transitions.get(transition, 0) + 1
+        if self.history is not None:
+            self.history.append((position, previous, state))
+        self.state = state
+        self.last = now
+
+    def stats(self):
+        return {
+            'visits': self.visits,
+            'seconds': self.seconds,
+            'transitions': self.transitions,
+            'history': list(self.history) if self.history is not None else [],
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as write_file:
+            json.dump(self.stats(), write_file, indent=4, ensure_ascii=False)
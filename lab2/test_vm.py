@@ -0,0 +1,122 @@
+import contextlib
+import importlib.util
+import io
+import os
+import unittest
+
+import main
+import vm
+from rpn import STRING, LAB2_DIALECT, render_rpn, parse_rpn
+
+# Вывод программы на стековой машине vm.py сравнивается с выводом exec()
+# исходного текста. ОПЗ берётся и из python_to_rpn (в CALL - точное число
+# аргументов), и из текста lab2 (в NФ - число листьев, вызываемое имя
+# ищется по стеку).
+PROGRAMS = {
+    'arith': 'x = 2 + 3 * 4\ny = x // 3\nz = x % 5 - y ** 2\nprint(x, y, z)\n',
+    'if': 'x = 5\nif x > 3:\n    print(1)\nelse:\n    print(2)\nif x < 3:\n    print(3)\nprint(4)\n',
+    'nested_if': 'for i in range(6):\n    if i % 2 == 0:\n        if i > 2:\n            print(i, 100)\n'
+                 '        else:\n            print(i, 200)\n    else:\n        print(i, 300)\n',
+    'ifexp': 'x = 3\ny = 10 if x > 2 else 20\nz = 10 if x > 5 else 20\nprint(y, z)\n',
+    'while': 'i = 0\ns = 0\nwhile i < 100:\n    s += i\n    i += 1\nprint(s)\n',
+    'func': 'def add(a, b):\n    return a + b\ndef fact(n):\n    if n < 2:\n        return 1\n'
+            '    return n * fact(n - 1)\nprint(add(2, 3), fact(10))\nprint(add(1 + 2, 3))\n',
+    'list': 'a = [1, 2, 3]\na[1] = 10\nprint(a, a[1], len(a))\nd = {1: 2, 3: 4}\nprint(d[3])\n'
+            'for v in a:\n    print(v)\n',
+    'strings': 'name = "world"\nprint("hello", name)\n',
+    'bool': 'x = 1\ny = 0\nprint(x and y, x or y, not y)\n',
+    'nested_calls': 'print(max(1, min(5, 3)), abs(2 - 5), len([1, 2]))\nprint()\n',
+    # имена встроенных функций как переменные
+    'shadowed_sum': 'sum = 0\nfor i in range(10):\n    sum += i\nprint(sum)\n',
+    'shadowed_list': 'list = [1]\nprint(list)\n',
+    'shadowed_loop': 'for max in range(3):\n    print(max)\n',
+    'shadowed_param': 'def f(len):\n    return len + 1\nprint(f(2))\n',
+}
+
+
+# оптимизатор lab3 работает с тем же rpn.py; его вывод (например,
+# отрицательные числа после свёртки) должна выполнять и стековая машина
+OPTIMIZE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lab3', 'optimize.py')
+
+OPTIMIZED_PROGRAMS = {
+    'negative': 'x = 2 - 5\ny = x * 3\nprint(x, y, 1 - 2.5)\n',
+    'negative_folded_twice': 'x = (2 - 3) * 4 - 1\nprint(x)\n',
+    'constant_condition': 'if 2 - 3 < 0:\n    print(1)\nelse:\n    print(2)\n',
+    'cse': 'l = [2, 3]\nx = l[0] * l[1] + l[0] * l[1]\nprint(x)\n',
+    'dead_store': 'a = 1\nb = 2\nprint(b)\n',
+    'strings': "x = '2' * 3\nprint(x, '1' + '2')\n",
+}
+
+
+def load_optimize():
+    spec = importlib.util.spec_from_file_location('lab3_optimize', OPTIMIZE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def exec_output(source_code):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        exec(source_code, {})
+    return output.getvalue()
+
+
+def vm_output(rpn, superinstructions=True):
+    output = io.StringIO()
+    program = vm.compile_rpn(rpn, superinstructions)
+    with contextlib.redirect_stdout(output):
+        vm.run(program)
+    return output.getvalue()
+
+
+def python_to_rpn(source_code):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return main.python_to_rpn(source_code)
+
+
+class VmTest(unittest.TestCase):
+    def check(self, rpn, expected):
+        for superinstructions in (True, False):
+            with self.subTest(superinstructions=superinstructions):
+                self.assertEqual(vm_output(rpn, superinstructions), expected)
+
+    def test_programs_match_exec(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(program=name):
+                self.check(python_to_rpn(source), exec_output(source))
+
+    def test_rpn_text_matches_exec(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(program=name):
+                text = render_rpn(python_to_rpn(source), LAB2_DIALECT)
+                self.check(parse_rpn(text, LAB2_DIALECT), exec_output(source))
+
+    def test_attribute(self):
+        # в тексте атрибут не отличить от имени, поэтому только ОПЗ из python_to_rpn
+        source = 'x = 3\nprint(x.real, x.imag + 1)\n'
+        self.check(python_to_rpn(source), exec_output(source))
+
+    def test_function_as_value_is_not_called(self):
+        source = 'def f(a):\n    print("called")\n    return a\nprint(f)\n'
+        rpn = python_to_rpn(source)
+        text = render_rpn(rpn, LAB2_DIALECT)
+        for rpn in (rpn, parse_rpn(text, LAB2_DIALECT)):
+            output = vm_output(rpn)
+            self.assertNotIn('called', output)
+            self.assertEqual(len(output.splitlines()), 1)
+
+
+    def test_optimized_programs_match_exec(self):
+        optimize = load_optimize().optimize
+        for name, source in OPTIMIZED_PROGRAMS.items():
+            with self.subTest(program=name):
+                rpn, _ = optimize(python_to_rpn(source))
+                self.check(rpn, exec_output(source))
+                if all(kind != STRING for kind, _ in rpn):
+                    # и через текст gen/rpn.txt, где строка '2' неотличима от числа 2
+                    self.check(parse_rpn(render_rpn(rpn, LAB2_DIALECT), LAB2_DIALECT), exec_output(source))
+
+
+if __name__ == '__main__':
+    unittest.main()
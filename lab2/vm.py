@@ -0,0 +1,587 @@
+import argparse
+import operator
+import time
+from array import array
+from collections import namedtuple
+
+from rpn import FUNCTION, LABEL, LAB2_DIALECT, parse_rpn
+
+# Стековая машина для ОПЗ. compile_rpn переводит список команд rpn.py (или
+# текст gen/rpn.txt через parse_rpn) в массив кодов операций с аргументами;
+# метки М1/М2 в ОПЗ одинаковы у всех условных операторов, поэтому переходы
+# разрешаются по вложенности блоков (УПЛ ... БП ... М2, НУЦ/КУЦ, НИЦ/КИЦ) и
+# в коде хранятся уже номерами команд. run выполняет код: стек - заранее
+# выделенный список с указателем вершины, команда выбирается из таблицы
+# обработчиков по коду операции.
+#
+# Значения, которые выражение-оператор оставляет на стеке (например,
+# результат print(x)), снимаются в конце блока, чтобы цикл не наращивал стек.
+# Строки python_to_rpn передаёт командами STRING. В тексте ОПЗ они пишутся
+# без кавычек, поэтому операнд, который не число и не имя со значением,
+# считается строкой.
+
+# коды операций
+(OP_NOP, OP_LOAD_CONST, OP_LOAD_NAME, OP_STORE_NAME, OP_STORE_SUBSCR, OP_INPLACE, OP_BINARY, OP_NOT,
+ OP_SUBSCR, OP_CALL, OP_RETURN, OP_DEF_FUNCTION, OP_BUILD_LIST, OP_BUILD_DICT, OP_GET_ITER, OP_FOR_ITER,
+ OP_POP, OP_JUMP, OP_POP_JUMP_IF_FALSE, OP_HALT, OP_ATTRIBUTE,
+ # суперкоманды: пары команд, слитые в одну (см. FUSIONS)
+ OP_STORE_CONST, OP_LOAD_NAME2, OP_BINARY_CONST, OP_BINARY_JUMP_IF_FALSE) = range(25)
+
+FUSIONS = {
+    (OP_LOAD_CONST, OP_STORE_NAME): OP_STORE_CONST,
+    (OP_LOAD_NAME, OP_LOAD_NAME): OP_LOAD_NAME2,
+    (OP_LOAD_CONST, OP_BINARY): OP_BINARY_CONST,
+    (OP_BINARY, OP_POP_JUMP_IF_FALSE): OP_BINARY_JUMP_IF_FALSE,
+}
+
+BINARY_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '//': operator.floordiv,
+    '%': operator.mod,
+    '**': operator.pow,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'and': lambda a, b: a and b,
+    'or': lambda a, b: a or b,
+}
+
+INPLACE_OPERATORS = {
+    '+=': operator.add,
+    '-=': operator.sub,
+    '*=': operator.mul,
+    '/=': operator.truediv,
+    '**=': operator.pow,
+}
+
+BUILTINS = {
+    'print': print,
+    'len': len,
+    'range': range,
+    'str': str,
+    'int': int,
+    'float': float,
+    'abs': abs,
+    'min': min,
+    'max': max,
+    'sum': sum,
+    'list': list,
+}
+
+# скомпилированная программа: коды операций, их аргументы, нужная глубина стека
+Program = namedtuple('Program', 'ops args depth')
+# функция программы: вход - номер первой команды тела
+Function = namedtuple('Function', 'name params entry depth')
+# значение на стеке при компиляции: первая команда выражения и команда,
+# которая положила значение
+Slot = namedtuple('Slot', 'start producer')
+
+
+def constant(text):
+    # число из текста ОПЗ (str(int), str(float), str(complex), в том числе
+    # отрицательное: -1 пишет свёртка констант optimize.py lab3) или None
+    unsigned = text[1:] if text.startswith('-') else text
+    if not unsigned or unsigned[0] not in '0123456789.(':
+        return None
+    for convert in (int, float, complex):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return None
+
+
+class Compiler:
+    def __init__(self, callables):
+        # имена, которые можно вызвать: функции программы и BUILTINS
+        self.callables = callables
+        # имена, которым присваивается значение, см. compile_rpn
+        self.stores = set()
+        self.ops = []
+        self.args = []
+        self.labels = []
+        self.slots = []
+        self.blocks = []
+        self.depth = 0
+        self.skip_label = False
+
+    def emit(self, op, arg=None):
+        self.ops.append(op)
+        self.args.append(arg)
+        return len(self.ops) - 1
+
+    def new_label(self):
+        self.labels.append(None)
+        return len(self.labels) - 1
+
+    def place(self, label, position=None):
+        self.labels[label] = len(self.ops) if position is None else position
+
+    def push(self, start, producer):
+        self.slots.append(Slot(start, producer))
+        self.depth = max(self.depth, len(self.slots))
+
+    def pop(self, count=1):
+        if count > len(self.slots):
+            raise ValueError('RPN stack underflow at instruction %d' % len(self.ops))
+        popped = self.slots[len(self.slots) - count:]
+        del self.slots[len(self.slots) - count:]
+        return popped[0] if count == 1 else popped
+
+    def discard(self, depth):
+        # снимает значения выражений-операторов выше глубины блока
+        if len(self.slots) > depth:
+            self.emit(OP_POP, len(self.slots) - depth)
+            del self.slots[depth:]
+
+    def target(self, slot, *ops):
+        # команда, положившая цель присваивания; её значение не нужно
+        if slot.producer is None or self.ops[slot.producer] not in ops:
+            raise ValueError('unsupported assignment target at instruction %d' % len(self.ops))
+        op = self.ops[slot.producer]
+        self.ops[slot.producer] = OP_NOP
+        return op, self.args[slot.producer]
+
+    def instruction(self, kind, value):
+        if self.skip_label:
+            # метка М1 после БП уже учтена в jump
+            self.skip_label = False
+            if kind == LABEL:
+                return
+        # метод компилятора для каждого вида команды называется так же
+        getattr(self, kind)(value)
+
+    def operand(self, value):
+        number = constant(value)
+        if number is None:
+            k = self.emit(OP_LOAD_NAME, value)
+        else:
+            k = self.emit(OP_LOAD_CONST, number)
+        self.push(k, k)
+
+    def string(self, value):
+        k = self.emit(OP_LOAD_CONST, value)
+        self.push(k, k)
+
+    def attribute(self, value):
+        value_slot = self.pop()
+        self.push(value_slot.start, self.emit(OP_ATTRIBUTE, value))
+
+    def operator(self, value):
+        if value == '=':
+            self.pop()
+            op, name = self.target(self.pop(), OP_LOAD_NAME, OP_SUBSCR)
+            if op == OP_LOAD_NAME:
+                self.stores.add(name)
+                self.emit(OP_STORE_NAME, name)
+            else:
+                # контейнер и индекс остаются на стеке для OP_STORE_SUBSCR
+                self.depth = max(self.depth, len(self.slots) + 3)
+                self.emit(OP_STORE_SUBSCR)
+        elif value in INPLACE_OPERATORS:
+            self.pop()
+            slot = self.pop()
+            if slot.producer is None or self.ops[slot.producer] != OP_LOAD_NAME:
+                raise ValueError('unsupported assignment target at instruction %d' % len(self.ops))
+            self.stores.add(self.args[slot.producer])
+            self.emit(OP_INPLACE, (INPLACE_OPERATORS[value], self.args[slot.producer]))
+        elif value in BINARY_OPERATORS:
+            self.pop()
+            left = self.pop()
+            self.push(left.start, self.emit(OP_BINARY, BINARY_OPERATORS[value]))
+        elif value == 'not':
+            operand = self.pop()
+            self.push(operand.start, self.emit(OP_NOT))
+        elif value == 'АЭМ':
+            self.pop()
+            container = self.pop()
+            self.push(container.start, self.emit(OP_SUBSCR))
+        elif value == 'return':
+            self.pop()
+            self.emit(OP_RETURN)
+        elif value == 'in':
+            self.pop()
+            target = self.pop()
+            _, name = self.target(target, OP_LOAD_NAME)
+            self.stores.add(name)
+            self.push(target.start, self.emit(OP_GET_ITER))
+            self.blocks.append({'kind': 'in', 'name': name})
+        else:
+            raise ValueError('operator %s is not supported' % value)
+
+    def call(self, value):
+        if isinstance(value, tuple):
+            # из python_to_rpn: (число аргументов, NФ)
+            arity = value[0]
+            if arity >= len(self.slots):
+                raise ValueError('RPN stack underflow at instruction %d' % len(self.ops))
+        else:
+            arity = self.guess_arity(value)
+        self.pop(arity)
+        callee = self.pop()
+        self.push(callee.start, self.emit(OP_CALL, arity))
+
+    def guess_arity(self, value):
+        # NФ из текста lab2 - число листьев аргументов (calcTreeNodes): у
+        # каждого аргумента хотя бы один лист, так что аргументов от 1 до
+        # value (0 - только при 0Ф). Вызываемое имя - ближайшее к вершине
+        # стека имя функции среди value + 1 верхних значений
+        for arity in range(min(value, 1), min(value, len(self.slots) - 1) + 1):
+            if self.is_callable(self.slots[-arity - 1]):
+                return arity
+        raise ValueError('no callable for %dФ at instruction %d' % (value, len(self.ops)))
+
+    def is_callable(self, slot):
+        return (slot.producer is not None and self.ops[slot.producer] == OP_LOAD_NAME
+                and self.args[slot.producer] in self.callables)
+
+    def function(self, value):
+        name, params = value
+        self.stores.update(params)
+        skip = self.new_label()
+        entry = self.new_label()
+        definition = self.emit(OP_DEF_FUNCTION, None)
+        self.emit(OP_JUMP, skip)
+        self.place(entry)
+        self.blocks.append({'kind': 'function', 'name': name, 'params': params, 'entry': entry, 'skip': skip,
+                            'definition': definition, 'slots': self.slots, 'depth': self.depth})
+        self.slots = []
+        self.depth = 0
+
+    def begin(self, value):
+        if value == 'НФ':
+            return
+        if value == 'НИЦ':
+            block = self.blocks.pop()
+            if block['kind'] != 'in':
+                raise ValueError('НИЦ without in at instruction %d' % len(self.ops))
+            loop = self.new_label()
+            end = self.new_label()
+            self.place(loop)
+            self.emit(OP_FOR_ITER, (block['name'], end))
+            self.blocks.append({'kind': 'for', 'loop': loop, 'end': end, 'depth': len(self.slots)})
+        elif value == 'НУЦ':
+            test = self.pop()
+            loop = self.new_label()
+            end = self.new_label()
+            self.place(loop, test.start)
+            self.emit(OP_POP_JUMP_IF_FALSE, end)
+            self.blocks.append({'kind': 'while', 'loop': loop, 'end': end, 'depth': len(self.slots)})
+        else:
+            self.blocks.append({'kind': value, 'depth': len(self.slots), 'start': len(self.ops)})
+
+    def end(self, value):
+        block = self.blocks.pop()
+        if value == 'КФ':
+            self.discard(0)
+            self.emit(OP_LOAD_CONST, None)
+            self.emit(OP_RETURN)
+            self.place(block['skip'])
+            self.args[block['definition']] = (block['name'], block['params'], block['entry'], self.depth + 1)
+            self.slots = block['slots']
+            self.depth = block['depth']
+        elif value in ('КИЦ', 'КУЦ'):
+            self.discard(block['depth'])
+            self.emit(OP_JUMP, block['loop'])
+            self.place(block['end'])
+            if value == 'КИЦ':
+                # итератор снимает OP_FOR_ITER
+                self.pop()
+        else:
+            items = self.pop(len(self.slots) - block['depth'])
+            items = [items] if isinstance(items, Slot) else items
+            start = items[0].start if items else len(self.ops)
+            if value == ']':
+                self.push(start, self.emit(OP_BUILD_LIST, len(items)))
+            else:
+                self.push(start, self.emit(OP_BUILD_DICT, len(items) // 2))
+
+    def separator(self, value):
+        pass
+
+    def jump_if_false(self, value):
+        test = self.pop()
+        self.blocks.append({'kind': 'if', 'depth': len(self.slots), 'start': test.start,
+                            'else': self.new_label(), 'end': None})
+        self.emit(OP_POP_JUMP_IF_FALSE, self.blocks[-1]['else'])
+
+    def jump(self, value):
+        block = self.blocks[-1]
+        # сколько значений оставит ветка: решается, когда известна и вторая
+        block['body'] = len(self.slots) - block['depth']
+        block['body_pop'] = self.emit(OP_POP, 0)
+        block['end'] = self.new_label()
+        self.emit(OP_JUMP, block['end'])
+        self.place(block['else'])
+        del self.slots[block['depth']:]
+        self.skip_label = True
+
+    def label(self, value):
+        if not self.blocks or self.blocks[-1]['kind'] != 'if':
+            return
+        block = self.blocks.pop()
+        if block['end'] is None:
+            self.discard(block['depth'])
+            self.place(block['else'])
+            return
+        # условное выражение оставляет одно значение из любой ветки
+        orelse = len(self.slots) - block['depth']
+        keep = min(1, block['body'], orelse)
+        self.args[block['body_pop']] = block['body'] - keep
+        self.discard(block['depth'] + keep)
+        self.place(block['end'])
+        if keep:
+            self.pop()
+            self.push(block['start'], None)
+
+    def program(self, superinstructions):
+        self.emit(OP_HALT)
+        if self.blocks:
+            raise ValueError('unterminated %s block' % self.blocks[-1]['kind'])
+        targets = set(self.labels)
+        ops = array('B')
+        args = []
+        positions = []
+        k = 0
+        while k < len(self.ops):
+            op, arg = self.ops[k], self.args[k]
+            positions.append(len(ops))
+            if op == OP_NOP or op == OP_POP and not arg:
+                k += 1
+                continue
+            if superinstructions and k + 1 < len(self.ops) and k + 1 not in targets:
+                fused = FUSIONS.get((op, self.ops[k + 1]))
+                if fused is not None:
+                    positions.append(len(ops))
+                    ops.append(fused)
+                    args.append((arg, self.args[k + 1]))
+                    k += 2
+                    continue
+            ops.append(op)
+            args.append(arg)
+            k += 1
+        positions.append(len(ops))
+
+        # метки - номерами команд итогового кода
+        resolve = {label: positions[position] for label, position in enumerate(self.labels)}
+        for k, op in enumerate(ops):
+            arg = args[k]
+            if op in (OP_JUMP, OP_POP_JUMP_IF_FALSE):
+                args[k] = resolve[arg]
+            elif op == OP_FOR_ITER:
+                args[k] = arg[0], resolve[arg[1]]
+            elif op == OP_BINARY_JUMP_IF_FALSE:
+                args[k] = arg[0], resolve[arg[1]]
+            elif op == OP_DEF_FUNCTION:
+                name, params, entry, depth = arg
+                args[k] = Function(name, params, resolve[entry], depth)
+        return Program(ops, args, self.depth + 1)
+
+
+def compile_rpn(rpn, superinstructions=True, builtins=BUILTINS):
+    """Program по ОПЗ - списку команд rpn.py."""
+    callables = set(builtins) | {value[0] for kind, value in rpn if kind == FUNCTION}
+    while True:
+        compiler = Compiler(callables)
+        try:
+            for kind, value in rpn:
+                compiler.instruction(kind, value)
+        except ValueError:
+            # вызов мог быть разобран неверно из-за имени, которое на самом
+            # деле переменная (sum = 0; print(sum)) - тогда ещё попытка
+            if not callables & compiler.stores:
+                raise
+        else:
+            if not callables & compiler.stores:
+                return compiler.program(superinstructions)
+        # имя, которому где-либо в программе присваивается значение (или
+        # параметр функции), - переменная, а не функция; без вызовов по
+        # догадке (NФ из текста ОПЗ) это не нужно, но и не мешает
+        callables -= compiler.stores
+
+
+def run(program, builtins=BUILTINS):
+    """Выполняет программу, возвращает её глобальные переменные."""
+    ops, args = program.ops, program.args
+    stack = [None] * program.depth
+    global_names = {}
+    names = global_names
+    frames = []
+    pc = sp = 0
+    end = len(ops)
+
+    def load(name):
+        if name in names:
+            return names[name]
+        if name in global_names:
+            return global_names[name]
+        return builtins.get(name, name)
+
+    def nop(arg):
+        pass
+
+    def load_const(arg):
+        nonlocal sp
+        stack[sp] = arg
+        sp += 1
+
+    def load_name(arg):
+        nonlocal sp
+        stack[sp] = load(arg)
+        sp += 1
+
+    def store_name(arg):
+        nonlocal sp
+        sp -= 1
+        names[arg] = stack[sp]
+
+    def store_subscr(arg):
+        nonlocal sp
+        sp -= 3
+        stack[sp][stack[sp + 1]] = stack[sp + 2]
+
+    def inplace(arg):
+        nonlocal sp
+        function, name = arg
+        sp -= 2
+        names[name] = function(stack[sp], stack[sp + 1])
+
+    def binary(arg):
+        nonlocal sp
+        sp -= 1
+        stack[sp - 1] = arg(stack[sp - 1], stack[sp])
+
+    def not_(arg):
+        stack[sp - 1] = not stack[sp - 1]
+
+    def subscr(arg):
+        nonlocal sp
+        sp -= 1
+        stack[sp - 1] = stack[sp - 1][stack[sp]]
+
+    def call(arg):
+        nonlocal sp, pc, names
+        sp -= arg
+        callee = stack[sp - 1]
+        if type(callee) is Function:
+            if len(callee.params) != arg:
+                raise TypeError('%s() takes %d arguments (%d given)' % (callee.name, len(callee.params), arg))
+            frames.append((pc, names, sp - 1))
+            names = dict(zip(callee.params, stack[sp:sp + arg]))
+            sp -= 1
+            if sp + callee.depth > len(stack):
+                stack.extend([None] * max(len(stack), callee.depth))
+            pc = callee.entry
+        else:
+            stack[sp - 1] = callee(*stack[sp:sp + arg])
+
+    def return_(arg):
+        nonlocal sp, pc, names
+        if not frames:
+            pc = end
+            return
+        value = stack[sp - 1]
+        pc, names, sp = frames.pop()
+        stack[sp] = value
+        sp += 1
+
+    def def_function(arg):
+        names[arg.name] = arg
+
+    def build_list(arg):
+        nonlocal sp
+        sp -= arg
+        stack[sp] = stack[sp:sp + arg]
+        sp += 1
+
+    def build_dict(arg):
+        nonlocal sp
+        sp -= 2 * arg
+        items = stack[sp:sp + 2 * arg]
+        stack[sp] = dict(zip(items[::2], items[1::2]))
+        sp += 1
+
+    def get_iter(arg):
+        stack[sp - 1] = iter(stack[sp - 1])
+
+    def for_iter(arg):
+        nonlocal sp, pc
+        for value in stack[sp - 1]:
+            names[arg[0]] = value
+            return
+        sp -= 1
+        pc = arg[1]
+
+    def pop(arg):
+        nonlocal sp
+        sp -= arg
+
+    def jump(arg):
+        nonlocal pc
+        pc = arg
+
+    def pop_jump_if_false(arg):
+        nonlocal sp, pc
+        sp -= 1
+        if not stack[sp]:
+            pc = arg
+
+    def halt(arg):
+        nonlocal pc
+        pc = end
+
+    def attribute(arg):
+        stack[sp - 1] = getattr(stack[sp - 1], arg)
+
+    def store_const(arg):
+        names[arg[1]] = arg[0]
+
+    def load_name2(arg):
+        nonlocal sp
+        stack[sp] = load(arg[0])
+        stack[sp + 1] = load(arg[1])
+        sp += 2
+
+    def binary_const(arg):
+        stack[sp - 1] = arg[1](stack[sp - 1], arg[0])
+
+    def binary_jump_if_false(arg):
+        nonlocal sp, pc
+        sp -= 2
+        if not arg[0](stack[sp], stack[sp + 1]):
+            pc = arg[1]
+
+    table = [nop, load_const, load_name, store_name, store_subscr, inplace, binary, not_, subscr, call,
+             return_, def_function, build_list, build_dict, get_iter, for_iter, pop, jump, pop_jump_if_false,
+             halt, attribute, store_const, load_name2, binary_const, binary_jump_if_false]
+
+    while pc < end:
+        op = ops[pc]
+        arg = args[pc]
+        pc += 1
+        table[op](arg)
+    return global_names
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Выполнение ОПЗ lab2 на стековой машине')
+    parser.add_argument('rpn', nargs='?', default='./gen/rpn.txt')
+    parser.add_argument('--plain', action='store_true', help='без суперкоманд')
+    parser.add_argument('--bench', type=int, default=0, metavar='N', help='замерить N прогонов без вывода')
+    args = parser.parse_args()
+    with open(args.rpn, 'r') as f:
+        program = compile_rpn(parse_rpn(f.read(), LAB2_DIALECT), not args.plain)
+    if args.bench:
+        quiet = dict(BUILTINS, print=lambda *values: None)
+        start = time.perf_counter()
+        for _ in range(args.bench):
+            run(program, quiet)
+        print('%d команд, %.3f мс на прогон' % (len(program.ops), (time.perf_counter() - start) * 1000 / args.bench))
+    else:
+        run(program)
@@ -0,0 +1,85 @@
+# Сборка текста Java-программы для rpn_to_java. Строки main и каждого
+# класса функции копятся в своих списках со своим отступом и склеиваются
+# один раз в text(), так что классы функций (в том числе вложенных) сразу
+# оказываются перед классом Program, без поиска и замен по готовому тексту.
+
+PROGRAM_HEAD = """public class Program {
+    class Unknown<T> {
+        private T ref;
+
+        public Unknown(T ref) {
+            this.ref = ref;
+        }
+
+        public T get() {
+            return ref;
+        }
+
+        public void set(T a) {
+            this.ref = a;
+        }
+    };
+
+    public static void main(String []args)
+    {""".split("\n")
+
+PROGRAM_TAIL = ["    }", "}"]
+
+# отступ операторов main и заголовка класса функции
+MAIN_INDENT = 8
+CLASS_INDENT = 4
+
+
+class JavaBuilder:
+    def __init__(self):
+        self.imports = ['java.util.ArrayList']
+        self.classes = []
+        # строки и отступ секции, в которую сейчас пишутся операторы
+        self.lines = []
+        self.indent = MAIN_INDENT
+        self.main = self.lines
+        # секции, прерванные функциями: (строки, отступ)
+        self.sections = []
+
+    def import_class(self, name):
+        if name not in self.imports:
+            self.imports.append(name)
+
+    def statement(self, text):
+        self.lines.append(" " * self.indent + text)
+
+    def open(self, text):
+        """Строка, после которой отступ увеличивается: "if (...) {"."""
+        self.statement(text)
+        self.indent += 4
+
+    def close(self, text="}"):
+        self.indent -= 4
+        self.statement(text)
+
+    def begin_function(self, name, params):
+        """Класс функции с методом call; операторы до end_function пишутся
+        в его тело."""
+        self.sections.append((self.lines, self.indent))
+        self.lines = []
+        self.classes.append(self.lines)
+        self.indent = CLASS_INDENT
+        self.open("static class " + name + " {")
+        self.open("public static Unknown<?> call(" + ", ".join("Unknown<?> " + param for param in params) + "){")
+
+    def end_function(self):
+        self.close("}")
+        self.close("};")
+        self.lines, self.indent = self.sections.pop()
+
+    def text(self):
+        lines = [""]
+        lines += ["    import " + name + ";" for name in self.imports]
+        lines.append("")
+        for function_class in self.classes:
+            lines += function_class
+            lines.append("")
+        lines += PROGRAM_HEAD
+        lines += self.main
+        lines += PROGRAM_TAIL
+        return "\n".join(lines)
@@ -1,8 +1,14 @@
 import ast
-import re
+import contextlib
+import io
+import sys
+import threading
+import tokenize
 from _ast import Module, AST
-from tkinter import *
-import tkinter.scrolledtext as st
+
+from rpn import (OPERAND, STRING, ATTRIBUTE, OPERATOR, CALL, FUNCTION, BEGIN, END, SEPARATOR, JUMP_IF_FALSE, JUMP,
+                 LABEL, LAB3_DIALECT, word, render_words, render_rpn, parse_rpn)
+from javacode import JavaBuilder
 
 binaryOperationNameToSymbol = {
     'Mult': '*',
@@ -41,297 +47,555 @@ compareAugAssignNameToSymbol = {
 }
 
 
-def convert_to_rpn(node):
-    if isinstance(node, ast.BinOp):
-        left = convert_to_rpn(node.left)
-        right = convert_to_rpn(node.right)
-        return left + right + binaryOperationNameToSymbol.get(node.op.__class__.__name__) + " "
-    elif isinstance(node, ast.Num):
-        return str(node.n) + " "
-    elif isinstance(node, ast.Expr):
-        return convert_to_rpn(node.value)
-    elif isinstance(node, ast.FunctionDef):
-        args = ",".join([arg.arg for arg in node.args.args])
-        body = " ".join([convert_to_rpn(n) for n in node.body])
-        return node.name + "(" + args + ") " + "НФ " + body + "КФ "
-    elif isinstance(node, ast.Assign):
-        target = convert_to_rpn(node.targets[0])
-        value = convert_to_rpn(node.value)
-        return target + value + "= "
-    elif isinstance(node, ast.Compare):
-        left = convert_to_rpn(node.left)
-        ops = " ".join([compareEqNameToSymbol.get(op.__class__.__name__) for op in node.ops])
-        comparators = " ".join([convert_to_rpn(comp) for comp in node.comparators])
-        return left + comparators + ops + " "
-    elif isinstance(node, ast.Return):
-        value = convert_to_rpn(node.value)
-        return value + "return "
-    elif isinstance(node, ast.Yield):
-        value = convert_to_rpn(node.value)
-        return value + "yield "
-    elif isinstance(node, ast.AugAssign):
-        target = convert_to_rpn(node.target)
-        value = convert_to_rpn(node.value)
-        return target + value + compareAugAssignNameToSymbol.get(node.op.__class__.__name__) + " "
-    elif isinstance(node, ast.For):
-        target = convert_to_rpn(node.target)
-        print(node.target)
-        iter = convert_to_rpn(node.iter)
-        body = " ".join([convert_to_rpn(n) for n in node.body])
-        return target + iter + "in " + "НИЦ " + body + "КИЦ "
-    elif isinstance(node, ast.While):
-        test = convert_to_rpn(node.test)
-        body = " ".join([convert_to_rpn(n) for n in node.body])
-        return test + "НУЦ " + body + "КУЦ "
-    elif isinstance(node, ast.List):
-        elts = ", ".join([convert_to_rpn(elt).strip() for elt in node.elts])
-        return " [ " + elts + " ] "
-    elif isinstance(node, ast.Dict):
-        keys = [convert_to_rpn(key) for key in node.keys]
-        values = [convert_to_rpn(value) for value in node.values]
-        key_value_pairs = [k + ": " + v for k, v in zip(keys, values)]
-        pairs_str = ", ".join(key_value_pairs)
-        return " { " + pairs_str + " } "
-    elif isinstance(node, ast.Attribute):
-        value = convert_to_rpn(node.value)
-        attr = node.attr
-        return value + attr + " "
-    elif isinstance(node, ast.Num):
-        return str(node.n) + " "
-    elif isinstance(node, ast.Call):
-        args = [convert_to_rpn(arg) for arg in node.args]
-        return node.func.id + " " + "".join(args) + str(len(node.args)) + "Ф "
-    elif isinstance(node, ast.Expr):
-        return convert_to_rpn(node.value)
-    elif isinstance(node, ast.If):
-        test = convert_to_rpn(node.test)
-        body = " ".join([convert_to_rpn(n) for n in node.body])
-        if len(node.orelse) == 0:
-            return test + "M1_УПЛ " + body + "М1 "
-        orelse = " ".join([convert_to_rpn(n) for n in node.orelse])
-        return test + "M1_УПЛ " + body + "М2_БП_М1 " + orelse + "М2 "
-    elif isinstance(node, ast.Subscript):
-        value = convert_to_rpn(node.value)
-        slice_value = convert_to_rpn(node.slice)
-        return value + slice_value + "АЭМ "
-    elif isinstance(node, ast.Slice):
-        lower = convert_to_rpn(node.lower) if node.lower is not None else ""
-        upper = convert_to_rpn(node.upper) if node.upper is not None else ""
-        step = convert_to_rpn(node.step) if node.step is not None else ""
-        return lower + upper + step + "SLICE "
-    elif isinstance(node, ast.UnaryOp):
-        operand = convert_to_rpn(node.operand)
-        return operand + compareUnaryNameToSymbol.get(node.op.__class__.__name__) + " "
-    elif isinstance(node, ast.Name):
-        return node.id + " "
-    elif isinstance(node, ast.BoolOp):
-        if len(node.values) == 2:
-            left = convert_to_rpn(node.values[0])
-            right = convert_to_rpn(node.values[1])
-            return left + right + compareBoolNameToSymbol.get(node.op.__class__.__name__) + " "
+# глубина рекурсии и размер стека потока для ast.parse, см. parse_python
+PARSE_RECURSION_LIMIT = 100000
+# PARSE_RECURSION_LIMIT уровней вместе с освобождением недостроенного
+# дерева при ошибке умещаются в 32 МБ; здесь - с запасом вдвое
+PARSE_STACK_SIZE = 64 * 1024 * 1024
+
+# предел рекурсии общий для всех потоков процесса, поэтому глубокие
+# разборы идут по одному, см. parse_python
+deepParseLock = threading.Lock()
+
+# число процессов для python_to_rpn в prog (None - без пула)
+PROCESSES = None
+
+# prog пишет ОПЗ по мере разбора, см. stream_rpn
+STREAM = False
+
+# prog прогоняет ОПЗ через проходы optimize.py (кроме потокового режима)
+OPTIMIZE = False
+
+# результаты prog по тексту программы, см. cache.py
+translationCache = None
+
+
+# Обработчики узлов AST для convert_to_rpn: тип узла -> функция, которая
+# возвращает ОПЗ узла как список: узлы AST (их ОПЗ подставляется на это
+# место) и готовые команды rpn.py. Обработчики не вызывают друг друга, так
+# что глубина дерева ограничена только памятью, а не стеком Python. Новый
+# тип узла добавляется декоратором converts.
+nodeTypeToConverter = {}
+
+
+def converts(*node_types):
+    def register(converter):
+        for node_type in node_types:
+            nodeTypeToConverter[node_type] = converter
+        return converter
+    return register
+
+
+def convert_to_rpn(node, out):
+    """Дописывает в out команды ОПЗ узла. Обход - с явным стеком:
+    на вершине - итератор по списку ещё не разобранного узла."""
+    stack = [iter((node,))]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, tuple):
+                out.append(item)
+                continue
+            converter = nodeTypeToConverter.get(type(item))
+            if converter is None:
+                print(item)
+                continue
+            stack.append(iter(converter(item)))
+            break
         else:
-            print(node.op, node.values)
-    elif isinstance(node, ast.Constant):
-        return node.value + " "
-    elif isinstance(node, ast.IfExp):
-        test = convert_to_rpn(node.test)
-        body = convert_to_rpn(node.body)
-        orelse = convert_to_rpn(node.orelse)
-        return test + "M1_УПЛ " + body + "М2_БП_М1 " + orelse + "М2 "
-    else:
-        print(node)
-        return ""
+            stack.pop()
+    return out
 
 
-def python_to_rpn(source_code):
-    tree = ast.parse(source_code)
-    rpn_expression = ""
-    for node in tree.body:
-        rpn_expression += convert_to_rpn(node)
+@converts(ast.Name)
+def convert_name(node):
+    return [(OPERAND, node.id)]
+
+
+@converts(ast.Constant)
+def convert_constant(node):
+    # числа (как проверка isinstance(node, ast.Num): bool - не число) и строки
+    if isinstance(node.value, (int, float, complex)) and not isinstance(node.value, bool):
+        return [(OPERAND, str(node.value))]
+    if isinstance(node.value, str):
+        return [(STRING, node.value)]
+    raise TypeError('unsupported constant %r' % (node.value,))
+
+
+@converts(ast.BinOp)
+def convert_bin_op(node):
+    return [node.left, node.right, (OPERATOR, binaryOperationNameToSymbol[node.op.__class__.__name__])]
+
+
+@converts(ast.Expr)
+def convert_expr(node):
+    return [node.value]
+
+
+@converts(ast.FunctionDef)
+def convert_function_def(node):
+    return [(FUNCTION, (node.name, [arg.arg for arg in node.args.args])), (BEGIN, "НФ"),
+            *node.body, (END, "КФ")]
+
+
+@converts(ast.Assign)
+def convert_assign(node):
+    return [node.targets[0], node.value, (OPERATOR, "=")]
+
+
+@converts(ast.Compare)
+def convert_compare(node):
+    return [node.left, *node.comparators,
+            *[(OPERATOR, compareEqNameToSymbol[op.__class__.__name__]) for op in node.ops]]
+
+
+@converts(ast.Return)
+def convert_return(node):
+    return [node.value, (OPERATOR, "return")]
+
+
+@converts(ast.Yield)
+def convert_yield(node):
+    return [node.value, (OPERATOR, "yield")]
+
+
+@converts(ast.AugAssign)
+def convert_aug_assign(node):
+    return [node.target, node.value, (OPERATOR, compareAugAssignNameToSymbol[node.op.__class__.__name__])]
 
-    return rpn_expression.strip().replace('  ', ' ')
 
+@converts(ast.For)
+def convert_for(node):
+    print(node.target)
+    return [node.target, node.iter, (OPERATOR, "in"), (BEGIN, "НИЦ"), *node.body, (END, "КИЦ")]
 
-def rpn_to_java(source_code):
-    result = ""
 
-    word_buffer: list[str] = source_code.replace('\n', '').split(" ")
+@converts(ast.While)
+def convert_while(node):
+    return [node.test, (BEGIN, "НУЦ"), *node.body, (END, "КУЦ")]
 
-    currentTabulation = 8
 
+@converts(ast.List)
+def convert_list(node):
+    items = [(BEGIN, "[")]
+    for k, elt in enumerate(node.elts):
+        if k:
+            items.append((SEPARATOR, ","))
+        items.append(elt)
+    items.append((END, "]"))
+    return items
+
+
+@converts(ast.Dict)
+def convert_dict(node):
+    items = [(BEGIN, "{")]
+    for k, (key, value) in enumerate(zip(node.keys, node.values)):
+        if k:
+            items.append((SEPARATOR, ","))
+        items += [key, (SEPARATOR, ":"), value]
+    items.append((END, "}"))
+    return items
+
+
+@converts(ast.Attribute)
+def convert_attribute(node):
+    return [node.value, (ATTRIBUTE, node.attr)]
+
+
+@converts(ast.Call)
+def convert_call(node):
+    return [(OPERAND, node.func.id), *node.args, (CALL, len(node.args))]
+
+
+@converts(ast.If)
+def convert_if(node):
+    if len(node.orelse) == 0:
+        return [node.test, (JUMP_IF_FALSE, "M1"), *node.body, (LABEL, "М1")]
+    return [node.test, (JUMP_IF_FALSE, "M1"), *node.body, (JUMP, "М2"), (LABEL, "М1"),
+            *node.orelse, (LABEL, "М2")]
+
+
+@converts(ast.IfExp)
+def convert_if_exp(node):
+    return [node.test, (JUMP_IF_FALSE, "M1"), node.body, (JUMP, "М2"), (LABEL, "М1"),
+            node.orelse, (LABEL, "М2")]
+
+
+@converts(ast.Subscript)
+def convert_subscript(node):
+    return [node.value, node.slice, (OPERATOR, "АЭМ")]
+
+
+@converts(ast.Slice)
+def convert_slice(node):
+    return [part for part in (node.lower, node.upper, node.step) if part is not None] + [(OPERATOR, "SLICE")]
+
+
+@converts(ast.UnaryOp)
+def convert_unary_op(node):
+    return [node.operand, (OPERATOR, compareUnaryNameToSymbol[node.op.__class__.__name__])]
+
+
+@converts(ast.BoolOp)
+def convert_bool_op(node):
+    if len(node.values) != 2:
+        print(node.op, node.values)
+        raise TypeError('%s with %d operands is not supported' % (node.op.__class__.__name__, len(node.values)))
+    return [node.values[0], node.values[1], (OPERATOR, compareBoolNameToSymbol[node.op.__class__.__name__])]
+
+
+def parse_python(source_code):
+    # ast.parse сам ограничен глубиной рекурсии интерпретатора, а
+    # сгенерированные выражения бывают вложены на тысячи уровней. Предел
+    # поднимается только на время разбора в отдельном потоке со стеком
+    # PARSE_STACK_SIZE: на обычном стеке парсер на C переполнил бы его раньше,
+    # чем сработает предел, и процесс бы упал. Программа, которая не
+    # разбирается и так, - SyntaxError, как любая другая ошибка в тексте.
+    # Обычные программы разбираются сразу, без потока.
     try:
-        while (word_buffer.index('[')):
-            start = word_buffer.index('[')
-            end = word_buffer.index(']')
-            arr = word_buffer[start + 1:end]
-            print(arr)
-            res = """new ArrayList<Unknown<?>>(){{
-            $1
-            }}""".replace(
-                '$1',
-                str.join("\n" + " " * (currentTabulation + 4),
-                         ["add(Unknown($1));".replace("$1", item.replace(',', '')) for item in arr])
-            )
-            word_buffer = word_buffer[0:start] + [res] + word_buffer[end + 1: len(word_buffer)]
-    except:
+        return ast.parse(source_code)
+    except (RecursionError, MemoryError):
         pass
 
-    unaryOperators = ['return', 'not', 'is']
+    outcome = []
 
-    print(word_buffer)
+    def parse():
+        with deepParseLock:
+            limit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(limit, PARSE_RECURSION_LIMIT))
+            try:
+                outcome.append(ast.parse(source_code))
+            except Exception as error:
+                outcome.append(error)
+            finally:
+                sys.setrecursionlimit(limit)
 
-    stack = []
+    stack_size = threading.stack_size(PARSE_STACK_SIZE)
+    try:
+        thread = threading.Thread(target=parse)
+        thread.start()
+    finally:
+        threading.stack_size(stack_size)
+    thread.join()
+
+    result, = outcome
+    if isinstance(result, (RecursionError, MemoryError)):
+        raise SyntaxError('program is nested too deeply to translate', ('<unknown>', 1, 0, None)) from result
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def python_to_rpn(source_code, processes=None):
+    """ОПЗ программы - список команд rpn.py; текст - render_rpn.
+    processes - число процессов для параллельного разбора (см. parallel_rpn)."""
+    tree = parse_python(source_code)
+    if processes is not None and processes > 1:
+        parts = split_statements(tree.body, processes)
+        if len(parts) > 1:
+            return parallel_rpn(source_code, parts, processes)
+    rpn = []
+    for node in tree.body:
+        convert_to_rpn(node, rpn)
+    return rpn
+
+
+# Параллельный разбор: операторы верхнего уровня независимы, поэтому их ОПЗ
+# можно строить по кускам в пуле процессов и склеить по порядку. В процесс
+# передаётся не поддерево AST (pickle рекурсивен и дорог на мелких узлах),
+# а текст куска целыми строками - процесс разбирает его сам.
+
+# куски мельче этого числа строк не выделяются
+MIN_PART_LINES = 200
+
+# пул создаётся при первом параллельном вызове и используется повторно
+rpnPool = None
+rpnPoolProcesses = None
+
+
+def split_statements(body, processes):
+    """Границы кусков - пары (первая строка, последняя строка) с нумерацией
+    с 1, как lineno в AST. Кусок кончается только там, где следующий
+    оператор начинается с новой строки."""
+    if not body:
+        return []
+    total = body[-1].end_lineno - body[0].lineno + 1
+    size = max(MIN_PART_LINES, total // (processes * 4))
+    parts = []
+    first = body[0].lineno
+    for node, following in zip(body, body[1:]):
+        if node.end_lineno - first + 1 >= size and following.lineno > node.end_lineno:
+            parts.append((first, node.end_lineno))
+            first = following.lineno
+    parts.append((first, body[-1].end_lineno))
+    return parts
+
+
+def convert_part(text):
+    rpn = []
+    for node in parse_python(text).body:
+        convert_to_rpn(node, rpn)
+    return rpn
+
+
+def get_translation_cache():
+    # версия кэша - хеш файлов транслятора (см. cache.py): считается при
+    # первой трансляции, а не при импорте main
+    global translationCache
+    if translationCache is None:
+        from cache import TranslationCache
+        translationCache = TranslationCache()
+    return translationCache
+
+
+def get_pool(processes):
+    global rpnPool, rpnPoolProcesses
+    if rpnPool is None or rpnPoolProcesses != processes:
+        if rpnPool is not None:
+            rpnPool.close()
+        # multiprocessing загружается только для пула: импорт main в
+        # процессах пула и из командной строки обходится без него
+        from multiprocessing import Pool
+        rpnPool = Pool(processes)
+        rpnPoolProcesses = processes
+    return rpnPool
+
+
+def parallel_rpn(source_code, parts, processes):
+    # строки режутся так же, как их считает ast: '\n', '\r\n' и '\r'
+    lines = io.StringIO(source_code, newline='').readlines()
+    texts = ["".join(lines[first - 1:last]) for first, last in parts]
+    rpn = []
+    for part in get_pool(processes).imap(convert_part, texts):
+        rpn += part
+    return rpn
+
+
+# литералы в ОПЗ: закрывающая скобка -> коллекция Java, которая их заменяет
+literalEndToJava = {
+    ']': 'ArrayList<Unknown<?>>',
+    '}': 'HashMap<Unknown<?>, Unknown<?>>',
+}
 
-    userFuncStack = []
+# встроенные функции Python, у которых есть замена в Java
+pythonFuncToJava = {
+    'print': 'System.out.println',
+}
 
-    pythonFuncs = {
-        'print': 'System.out.println'
-    }
 
-    for word in word_buffer:
-        print(stack)
+def rpn_to_java(rpn):
+    """Java-программа по ОПЗ - списку команд rpn.py (см. python_to_rpn)."""
+    java = JavaBuilder()
+
+    unaryOperators = ['return', 'not', 'is']
+
+    print(rpn)
+
+    stack = []
 
-        if word == '=':
-            tmp = (" " * currentTabulation + "$3 $1 = $2;\n"
-                   .replace('$2', stack.pop())
-                   .replace('$1', stack.pop())
-                   )
+    # открытые литералы списков и словарей: высота стека у их начала, всё,
+    # что выше, - их элементы
+    literals = []
 
-            if tmp.find("new ArrayList<Unknown<?>>") != -1:
-                tmp = tmp.replace('$3', "ArrayList<Unknown<?>>")
+    userFuncStack = []
+
+    # заголовок функции: (имя, параметры) до её НФ
+    function = None
+
+    def flush():
+        # значение, оставшееся на стеке в конце блока, - оператор-выражение
+        if stack:
+            java.statement(stack.pop() + ";")
+
+    instructions = iter(rpn)
+    for kind, value in instructions:
+        operation = value if kind == OPERATOR else None
+
+        if operation == '=':
+            expression = stack.pop()
+            javaType = "Unknown<?>"
+            for collection in literalEndToJava.values():
+                if expression.startswith("new " + collection + "("):
+                    javaType = collection
+            java.statement(javaType + " " + stack.pop() + " = " + expression + ";")
+        elif kind == BEGIN and value in '[{':
+            literals.append(len(stack))
+        elif kind == SEPARATOR:
+            # элементы литерала и так лежат на стеке по порядку
+            continue
+        elif kind == END and value in literalEndToJava:
+            start = literals.pop()
+            items = stack[start:]
+            del stack[start:]
+            if value == '}':
+                java.import_class('java.util.HashMap')
+                lines = ["put(Unknown(" + key + "), Unknown(" + item + "));"
+                         for key, item in zip(items[::2], items[1::2])]
+            else:
+                lines = ["add(Unknown(" + item + "));" for item in items]
+            # вложенный литерал - на отступ глубже объемлющего
+            indent = " " * (java.indent + 4 * (len(literals) + 1))
+            if lines:
+                stack.append("new " + literalEndToJava[value] + "(){{\n"
+                             + indent + ("\n" + indent).join(lines) + "\n"
+                             + indent + "}}")
             else:
-                tmp = tmp.replace('$3', "Unknown<?>")
-
-            result += tmp
-        elif word in ["+", "-", "/", "*", "**", "==", "!=", ">=", "<=", "<", ">"]:
-            stack.append(("$1 $3 $2"
-                          .replace('$2', stack.pop())
-                          .replace('$1', stack.pop())
-                          .replace('$3', word)
-                          ))
-        elif word == "M1_УПЛ":
-            result += (" " * currentTabulation + "if ($1) {\n"
-                       .replace('$1', stack.pop())
-                       )
-            currentTabulation += 4
-        elif re.search("^[0-9]+Ф$", word):
-            tmp = "("
-            amount = int(re.compile("[0-9]+").search(word).group(0))
-
-            print(stack,amount)
-
-            stack_reversed = []
-            for i in range(0, amount):
-                stack_reversed.append(stack.pop())
-
-            for i in range(0, amount):
-                tmp += "$1,".replace("$1", stack_reversed.pop())
+                stack.append("new " + literalEndToJava[value] + "()")
+        elif operation in ["+", "-", "/", "*", "**", "==", "!=", ">=", "<=", "<", ">"]:
+            right = stack.pop()
+            stack.append(stack.pop() + " " + operation + " " + right)
+        elif kind == JUMP_IF_FALSE:
+            java.open("if (" + stack.pop() + ") {")
+        elif kind == CALL:
+            args = stack[len(stack) - value:]
+            del stack[len(stack) - value:]
             funcName = stack.pop()
             if funcName in userFuncStack:
                 funcName += '.call'
-
-            stack.append((funcName + tmp + ")").replace(',)', ')'))
-        elif word == "М2_БП_М1":
-            if (len(stack)):
-                result += " " * currentTabulation + stack.pop() + ";\n"
-            currentTabulation -= 4
-            result += " " * currentTabulation + "}\n" + " " * currentTabulation + "else {\n"
-            currentTabulation += 4
-        elif word == 'АЭМ':
-            stack.append(("$1[$2]"
-                          .replace('$2', stack.pop())
-                          .replace('$1', stack.pop())
-                          ))
-        elif word == "М2":
-            if (len(stack)):
-                result += " " * currentTabulation + stack.pop() + ";\n"
-            currentTabulation -= 4
-            result += " " * currentTabulation + "}\n"
-        elif word == "НФ":
-            func = stack.pop()
-            funcName = func.split('(')[0]
+            else:
+                funcName = pythonFuncToJava.get(funcName, funcName)
+            stack.append(funcName + "(" + ",".join(args) + ")")
+        elif kind == JUMP:
+            # за БП всегда следует метка М1 ветки else
+            next(instructions)
+            flush()
+            java.close()
+            java.open("else {")
+        elif operation == 'АЭМ':
+            index = stack.pop()
+            stack.append(stack.pop() + "[" + index + "]")
+        elif kind == LABEL:
+            # конец ветки: М2 - после else, М1 - у if без else (метку М1
+            # ветки else забирает БП)
+            flush()
+            java.close()
+        elif kind == FUNCTION:
+            function = value
+        elif kind == BEGIN and value == "НФ":
+            funcName, params = function
             userFuncStack.append(funcName)
-            funcArgs = str.join(", ", ["Unknown<?> $1".replace("$1", arg) for arg in
-                                       ("(" + func.split('(')[1]).replace('(', "").split(",")])
-            tmp = " " * currentTabulation + """static class $3 {
-$1""".replace("$3", funcName)
-            currentTabulation += 4
-            tmp = tmp.replace("$1", " " * currentTabulation + "public static Unknown<?> call(" + funcArgs + "{\n")
-            currentTabulation += 4
-            result += tmp
-        elif word == 'КФ':
-            if (len(stack)):
-                result += " " * currentTabulation + stack.pop() + ";\n"
-            currentTabulation -= 4
-            result += " " * currentTabulation + "}\n"
-            currentTabulation -= 4
-            result += " " * currentTabulation + "}mark\n"
-        elif word in unaryOperators:
-            result += (" " * currentTabulation + "$1 $2;\n"
-                       .replace('$2', stack.pop())
-                       .replace('$1', word)
-                       )
+            java.begin_function(funcName, params)
+        elif kind == END and value == 'КФ':
+            flush()
+            java.end_function()
+        elif operation in unaryOperators:
+            java.statement(operation + " " + stack.pop() + ";")
         else:
-            stack.append(word)
+            stack.append(word((kind, value), LAB3_DIALECT))
 
-    if (len(stack)):
-        result += " " * currentTabulation + stack.pop() + ";"
+    flush()
 
+    print(stack)
 
-    for funcKey in pythonFuncs.keys():
-        result = result.replace(funcKey, pythonFuncs.get(funcKey))
+    return java.text()
 
-    print(stack)
-    funcie = None
-
-    if (re.search('static class[\s\S]*}mark', result)):
-        funcie = re.search('static class[\s\S]*}mark', result).group(0).replace('mark', ';\n')
-
-        funcieToRepl = re.search('static class[\s\S]*}mark', result).group(0).split('};')
-
-    x= """
-    import java.util.ArrayList;
-    
-    $2
-public class Program {
-    class Unknown<T> {
-        private T ref;
-
-        public Unknown(T ref) {
-            this.ref = ref;
-        }
-        
-        public T get() {
-            return ref;
-        }
-        
-        public void set(T a) {
-            this.ref = a;
-        }
-    };
-    
-    public static void main(String []args)
-    {
-$1
-    }
-}""".replace("$1", result)
-
-    if (funcie):
-        x = x.replace("$2", funcie)
-        for a in funcieToRepl:
-            x = x.replace(a, '')
-    else:
-        x = x.replace("$2", "")
 
-    return x
+# Потоковый режим prog (STREAM): файл читается токенизатором по строкам,
+# каждый оператор верхнего уровня разбирается отдельно, его ОПЗ сразу
+# пишется в выходной файл, а поддерево освобождается. AST всего файла и
+# вся ОПЗ в памяти не собираются - хватает памяти на самый большой оператор.
+
+# слова, с которых начинается продолжение составного оператора
+CONTINUATION_WORDS = {'else', 'elif', 'except', 'finally'}
+
+
+def top_level_statements(readline):
+    """Тексты операторов верхнего уровня по мере чтения: пары (номер первой
+    строки, текст целыми строками). Оператор кончается перед логической
+    строкой, которая начинается в первой колонке и не продолжает его
+    (else, except, ...) и которой не предшествует декоратор."""
+    lines = []
+
+    def read():
+        line = readline()
+        lines.append(line)
+        return line
+
+    first = 1
+    line_start = True
+    decorated = False
+    try:
+        for token in tokenize.generate_tokens(read):
+            if token.type in (tokenize.NL, tokenize.COMMENT, tokenize.INDENT, tokenize.DEDENT):
+                continue
+            if token.type == tokenize.NEWLINE:
+                line_start = True
+                continue
+            if token.type == tokenize.ENDMARKER:
+                break
+            if line_start:
+                row, column = token.start
+                if column == 0 and row > first and not decorated and token.string not in CONTINUATION_WORDS:
+                    yield first, "".join(lines[:row - first])
+                    del lines[:row - first]
+                    first = row
+                decorated = token.string == '@'
+                line_start = False
+    except tokenize.TokenError:
+        # незакрытая скобка или строка: ошибку сообщит ast.parse
+        pass
+    text = "".join(lines)
+    if text.strip():
+        yield first, text
+
+
+def stream_rpn(readline, write, dialect):
+    """Текст ОПЗ, как render_rpn(python_to_rpn(...)), по частям через write."""
+    separator = ""
+    for first, text in top_level_statements(readline):
+        try:
+            body = parse_python(text).body
+        except SyntaxError as error:
+            if error.lineno is not None:
+                error.lineno += first - 1
+            raise
+        body.reverse()
+        while body:
+            words = render_words(convert_to_rpn(body.pop(), []), dialect)
+            if words:
+                write(separator + " ".join(words))
+                separator = " "
+
+
+def program_rpn(text):
+    """ОПЗ программы - список команд; при OPTIMIZE - после optimize.py."""
+    rpn = python_to_rpn(text, PROCESSES)
+    if OPTIMIZE:
+        # optimize.py нужен только при OPTIMIZE
+        from optimize import optimize, format_stats
+        rpn, stats = optimize(rpn)
+        print(format_stats(stats))
+    return rpn
+
+
+def translate_rpn(input_sequence):
+    """Текст ОПЗ программы через кэш; при OPTIMIZE - после optimize.py."""
+    return get_translation_cache().cached('rpn-optimized' if OPTIMIZE else 'rpn', input_sequence,
+                                          lambda text: render_rpn(program_rpn(text), LAB3_DIALECT))
+
+
+def translate_java(rpn_text):
+    """Java-код по тексту ОПЗ через кэш."""
+    return get_translation_cache().cached('java', rpn_text, lambda text: rpn_to_java(parse_rpn(text, LAB3_DIALECT)))
+
+
+def translate_python_java(input_sequence):
+    """Java-код программы на Python через кэш: rpn_to_java получает ОПЗ
+    от python_to_rpn напрямую, без текста ОПЗ между ними."""
+    return get_translation_cache().cached('python-java-optimized' if OPTIMIZE else 'python-java', input_sequence,
+                                          lambda text: rpn_to_java(program_rpn(text)))
 
 
 def prog():
+    if STREAM:
+        with open('./resources/python.txt', 'r') as source, open('gen/rpn.txt', 'w') as target:
+            stream_rpn(source.readline, target.write, LAB3_DIALECT)
+        return
+
     f = open('./resources/python.txt', 'r')
     input_sequence = f.read()
     f.close()
 
-    out_seq = python_to_rpn(input_sequence)
+    out_seq = translate_rpn(input_sequence)
 
     # файл, содержащий обратную польскую запись
     f = open('gen/rpn.txt', 'w')
@@ -344,7 +608,7 @@ def prog2():
     input_sequence = f.read()
     f.close()
 
-    out_seq = rpn_to_java(input_sequence)
+    out_seq = translate_java(input_sequence)
 
     # файл, содержащий обратную польскую запись
     f = open('gen/res.txt', 'w')
@@ -357,62 +621,103 @@ def write_txt(data, to):
         file.write(data)
 
 
-def clicked():
-    write_txt(codetxt.get("1.0", "end"), 'resources/python.txt')
-
-    opzstext.delete("1.0", END)
-
-    prog()
-
-    f1 = open('gen/rpn.txt', 'r')
-    text = f1.read()
-    opzstext.insert("1.0", text)
-    f1.close()
-
-
-def clicked2():
-    write_txt(opzstext.get("1.0", "end"), 'gen/rpn.txt')
-
-    restext.delete("1.0", END)
-
-    prog2()
-
-    f1 = open('gen/res.txt', 'r')
-    text = f1.read()
-    restext.insert("1.0", text)
-    f1.close()
-
+def gui():
+    # tkinter загружается только для окна, см. startup.py
+    import tkinter as tk
+    import tkinter.scrolledtext as st
 
-window = Tk()
-window.title("LR3")
+    def clicked():
+        write_txt(codetxt.get("1.0", "end"), 'resources/python.txt')
 
-f1 = open('resources/python.txt', 'r')
-text = f1.read()
+        opzstext.delete("1.0", "end")
 
-f2 = open('gen/rpn.txt', 'r')
-text2 = f2.read()
+        prog()
 
-f3 = open('gen/res.txt', 'r')
-text3 = f3.read()
+        f1 = open('gen/rpn.txt', 'r')
+        text = f1.read()
+        opzstext.insert("1.0", text)
+        f1.close()
 
-window.geometry('1840x640')
+    def clicked2():
+        write_txt(opzstext.get("1.0", "end"), 'gen/rpn.txt')
 
-codetxt = st.ScrolledText(window, font=("Arial", 18))
-codetxt.insert("1.0", text)
-codetxt.place(x=20, y=20, width=400, height=600)
+        restext.delete("1.0", "end")
 
-opzstext = st.ScrolledText(window, font=("Arial", 18))
-opzstext.place(x=720, y=20, width=400, height=600)
-opzstext.insert("1.0", text2)
+        prog2()
 
-restext = st.ScrolledText(window, font=("Arial", 18))
-restext.place(x=1420, y=20, width=400, height=600)
-restext.insert("1.0", text3)
+        f1 = open('gen/res.txt', 'r')
+        text = f1.read()
+        restext.insert("1.0", text)
+        f1.close()
 
-btngo = Button(window, text="Выполнить \n преобразование", command=clicked, font=("Arial", 20))
-btngo.place(x=510 + 150 - 100 - 90, y=10 + 300 - 40, width=200, height=80)
+    window = tk.Tk()
+    window.title("LR3")
 
-btngo2 = Button(window, text="Выполнить \n преобразование", command=clicked2, font=("Arial", 20))
-btngo2.place(x=510 + 350 - 100 - 90 + 500, y=10 + 300 - 40, width=200, height=80)
+    f1 = open('resources/python.txt', 'r')
+    text = f1.read()
 
-window.mainloop()
+    f2 = open('gen/rpn.txt', 'r')
+    text2 = f2.read()
+
+    f3 = open('gen/res.txt', 'r')
+    text3 = f3.read()
+
+    window.geometry('1840x640')
+
+    codetxt = st.ScrolledText(window, font=("Arial", 18))
+    codetxt.insert("1.0", text)
+    codetxt.place(x=20, y=20, width=400, height=600)
+
+    opzstext = st.ScrolledText(window, font=("Arial", 18))
+    opzstext.place(x=720, y=20, width=400, height=600)
+    opzstext.insert("1.0", text2)
+
+    restext = st.ScrolledText(window, font=("Arial", 18))
+    restext.place(x=1420, y=20, width=400, height=600)
+    restext.insert("1.0", text3)
+
+    btngo = tk.Button(window, text="Выполнить \n преобразование", command=clicked, font=("Arial", 20))
+    btngo.place(x=510 + 150 - 100 - 90, y=10 + 300 - 40, width=200, height=80)
+
+    btngo2 = tk.Button(window, text="Выполнить \n преобразование", command=clicked2, font=("Arial", 20))
+    btngo2.place(x=510 + 350 - 100 - 90 + 500, y=10 + 300 - 40, width=200, height=80)
+
+    window.mainloop()
+
+
+# Без аргументов открывается окно, как раньше; с файлом - перевод без окна:
+#   python main.py resources/python.txt [-o gen/res.txt] [-j N] [--optimize]
+#   python main.py resources/python.txt --to rpn [-o gen/rpn.txt] [--stream]
+#   python main.py gen/rpn.txt --from rpn [-o gen/res.txt]
+if __name__ == '__main__':
+    # argparse - половина времени импорта main, нужен только здесь
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Перевод программы на Python в ОПЗ и в Java')
+    parser.add_argument('source', nargs='?', help='без аргументов открывается окно')
+    parser.add_argument('-o', '--out', help='файл результата (по умолчанию - стандартный вывод)')
+    parser.add_argument('--from', dest='source_kind', default='python', choices=('python', 'rpn'),
+                        help='source - программа на Python или текст ОПЗ')
+    parser.add_argument('--to', default='java', choices=('rpn', 'java'))
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='число процессов, см. python_to_rpn')
+    parser.add_argument('--stream', action='store_true', help='писать ОПЗ по мере разбора, см. stream_rpn')
+    parser.add_argument('--optimize', action='store_true', help='проходы optimize.py')
+    args = parser.parse_args()
+    if args.stream and (args.to != 'rpn' or args.optimize or args.source_kind != 'python'):
+        parser.error('--stream writes plain RPN of a Python source: use it with --to rpn only')
+    PROCESSES = args.jobs
+    OPTIMIZE = args.optimize
+    if args.source is None:
+        gui()
+    else:
+        # отладочная печать разбора уходит в stderr, в stdout - только результат
+        with open(args.source, 'r') as source, \
+                (open(args.out, 'w') if args.out else contextlib.nullcontext(sys.stdout)) as target, \
+                contextlib.redirect_stdout(sys.stderr):
+            if args.stream:
+                stream_rpn(source.readline, target.write, LAB3_DIALECT)
+            elif args.source_kind == 'python' and args.to == 'java':
+                target.write(translate_python_java(source.read()))
+            else:
+                rpn_text = source.read() if args.source_kind == 'rpn' else translate_rpn(source.read())
+                target.write(rpn_text if args.to == 'rpn' else translate_java(rpn_text))
@@ -0,0 +1,401 @@
+import math
+import operator
+from collections import namedtuple
+
+from rpn import (OPERAND, STRING, ATTRIBUTE, OPERATOR, CALL, FUNCTION, BEGIN, END, SEPARATOR, JUMP_IF_FALSE, JUMP,
+                 LABEL)
+
+# Оптимизация ОПЗ между python_to_rpn и rpn_to_java. Каждый проход получает
+# список команд rpn.py и возвращает новый список и число сделанных замен:
+#   fold_constants          - свёртка операций над числами (2 3 * -> 6) и
+#                             условий с постоянным сравнением (ветка, которая
+#                             не выполнится, удаляется);
+#   eliminate_common_subexpressions - повторяющиеся выражения без вызовов
+#                             вычисляются один раз во временную переменную
+#                             перед оператором, в котором они встречаются;
+#   eliminate_dead_code     - присваивания переменным, которые нигде не
+#                             читаются, и функции, которые нигде не вызываются.
+# Числом считается OPERAND, который читается как int, float или complex
+# (в том числе со знаком минус, как результат свёртки 2 - 3); строковые
+# литералы - команды STRING, они не сворачиваются.
+
+ARITHMETIC = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '//': operator.floordiv,
+    '%': operator.mod,
+    '**': operator.pow,
+}
+
+COMPARISONS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+ASSIGNMENTS = {'=', '+=', '-=', '*=', '/=', '**='}
+
+# операции с двумя операндами и одним результатом, без побочных эффектов
+PURE_BINARY = set(ARITHMETIC) | set(COMPARISONS) | {'and', 'or', 'АЭМ'}
+
+# начала и концы блоков операторов: стек выражений в них пуст
+STATEMENT_BLOCKS = {'НФ', 'КФ', 'НИЦ', 'КИЦ', 'НУЦ', 'КУЦ'}
+
+# показатель степени, выше которого 2 ** n не сворачивается
+MAX_FOLDED_POWER = 256
+
+CSE_PREFIX = '_cse'
+
+# значение на модельном стеке: первая команда выражения и признак того, что
+# в нём только операнды, строки и чистые операции (нет вызовов, переходов,
+# атрибутов)
+Slot = namedtuple('Slot', 'start pure')
+
+
+def constant(text):
+    # число из текста операнда (в том числе отрицательное: -1) или None
+    if not isinstance(text, str):
+        return None
+    unsigned = text[1:] if text.startswith('-') else text
+    if not unsigned or unsigned[0] not in '0123456789.(':
+        return None
+    for convert in (int, float, complex):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return None
+
+
+def number_text(number):
+    # текст операнда для свёрнутого значения или None, если его не записать
+    if isinstance(number, bool) or not isinstance(number, (int, float, complex)):
+        return None
+    if isinstance(number, float) and not math.isfinite(number):
+        return None
+    if isinstance(number, complex) and not (math.isfinite(number.real) and math.isfinite(number.imag)):
+        return None
+    return str(number)
+
+
+def compute(symbol, left, right):
+    if symbol == '**' and isinstance(right, int) and abs(right) > MAX_FOLDED_POWER:
+        return None
+    function = ARITHMETIC.get(symbol) or COMPARISONS.get(symbol)
+    try:
+        return function(left, right)
+    except (ArithmeticError, TypeError, ValueError):
+        return None
+
+
+def branches(rpn, k):
+    """Для УПЛ в позиции k: (позиция БП ветки else или None, позиция
+    метки, которой кончается условный оператор)."""
+    nested = []
+    jump = None
+    j = k + 1
+    while True:
+        kind, value = rpn[j]
+        if kind == JUMP_IF_FALSE:
+            nested.append(False)
+        elif kind == JUMP:
+            if nested:
+                nested[-1] = True
+            else:
+                jump = j
+            # за БП следует метка М1 начала else
+            j += 2
+            continue
+        elif kind == LABEL:
+            if not nested:
+                return jump, j
+            nested.pop()
+        j += 1
+
+
+def fold_constants(rpn):
+    out = []
+    folded = 0
+    # skip[k] - куда перейти, дойдя до k: удалённые ветки и их метки
+    skip = {}
+    k = 0
+    while k < len(rpn):
+        if k in skip:
+            k = skip.pop(k)
+            continue
+        kind, value = rpn[k]
+        if kind == OPERATOR and (value in ARITHMETIC or value in COMPARISONS) and len(out) >= 2 \
+                and out[-1][0] == OPERAND and out[-2][0] == OPERAND:
+            left, right = constant(out[-2][1]), constant(out[-1][1])
+            if left is not None and right is not None:
+                result = compute(value, left, right)
+                text = number_text(result) if value in ARITHMETIC else None
+                if text is not None:
+                    out[-2:] = [(OPERAND, text)]
+                    folded += 1
+                    k += 1
+                    continue
+                if value in COMPARISONS and result is not None and k + 1 < len(rpn) \
+                        and rpn[k + 1][0] == JUMP_IF_FALSE:
+                    # условие известно заранее: остаётся одна ветка без переходов
+                    jump, end = branches(rpn, k + 1)
+                    del out[-2:]
+                    folded += 1
+                    if result:
+                        skip[end if jump is None else jump] = end + 1
+                        k += 2
+                    else:
+                        if jump is not None:
+                            skip[end] = end + 1
+                        k = end + 1 if jump is None else jump + 2
+                    continue
+        out.append(rpn[k])
+        k += 1
+    return out, folded
+
+
+def simulate(rpn):
+    """Проход по ОПЗ с моделью стека: для каждой команды - (номер, снятые
+    значения, положенное значение или None, глубина стека после команды).
+    Если модель не точна (SLICE снимает неизвестное число частей среза), до
+    начала следующего блока операторов снятые значения и глубина - None, а
+    положенные значения не считаются чистыми."""
+    slots = []
+    exact = True
+    # для каждого открытого условного оператора: глубина стека после УПЛ,
+    # начало условия, сколько значений оставила ветка if
+    conditions = []
+    # глубины стека перед открытыми [ и {
+    literals = []
+
+    def take(count):
+        nonlocal exact
+        if count > len(slots):
+            del slots[:]
+            exact = False
+            return None
+        taken = slots[len(slots) - count:]
+        del slots[len(slots) - count:]
+        return taken
+
+    for k, (kind, value) in enumerate(rpn):
+        popped = ()
+        pushed = None
+        if kind in (OPERAND, STRING):
+            pushed = Slot(k, True)
+        elif kind == ATTRIBUTE:
+            popped = take(1)
+            pushed = Slot(popped[0].start if popped else k, False)
+        elif kind == OPERATOR:
+            if value in PURE_BINARY:
+                popped = take(2)
+                pushed = Slot(popped[0].start, popped[0].pure and popped[1].pure) if popped else Slot(k, False)
+            elif value == 'not':
+                popped = take(1)
+                pushed = Slot(popped[0].start, popped[0].pure) if popped else Slot(k, False)
+            elif value in ASSIGNMENTS:
+                popped = take(2)
+            elif value == 'in':
+                popped = take(2)
+                pushed = Slot(popped[0].start if popped else k, False)
+            elif value == 'SLICE':
+                exact = False
+                pushed = Slot(k, False)
+            else:
+                # return, yield
+                popped = take(1)
+        elif kind == CALL:
+            # значение - число аргументов или пара (число аргументов, NФ), см. rpn.py
+            popped = take((value[0] if isinstance(value, tuple) else value) + 1)
+            pushed = Slot(popped[0].start if popped else k, False)
+        elif kind == JUMP_IF_FALSE:
+            test = take(1)
+            conditions.append([len(slots), test[0].start if test else k, None])
+        elif kind == JUMP:
+            if conditions:
+                condition = conditions[-1]
+                condition[2] = len(slots) - condition[0]
+                del slots[condition[0]:]
+        elif kind == LABEL:
+            if value == 'М2' and conditions:
+                depth, start, body = conditions.pop()
+                orelse = len(slots) - depth
+                del slots[depth:]
+                if body and orelse:
+                    # условное выражение: значение одной из веток
+                    pushed = Slot(start, False)
+            elif conditions and conditions[-1][2] is None:
+                conditions.pop()
+        elif kind == BEGIN:
+            if value in STATEMENT_BLOCKS:
+                del slots[:]
+                exact = True
+            else:
+                literals.append(len(slots))
+        elif kind == END:
+            if value in STATEMENT_BLOCKS:
+                del slots[:]
+                exact = True
+            elif literals:
+                depth = literals.pop()
+                start = slots[depth].start if depth < len(slots) else k
+                del slots[depth:]
+                # каждый литерал - новый изменяемый объект, его нельзя вычислить один раз
+                pushed = Slot(start, False)
+        elif kind == FUNCTION:
+            del slots[:]
+            exact = True
+        depth = len(slots) + (pushed is not None)
+        if not exact:
+            popped = depth = None
+            if pushed is not None:
+                pushed = Slot(pushed.start, False)
+        yield k, popped, pushed, depth
+        if pushed is not None:
+            slots.append(pushed)
+
+
+def eliminate_common_subexpressions(rpn, prefix=CSE_PREFIX):
+    """Внутри участка без присваиваний, вызовов и переходов одинаковые
+    чистые выражения вычисляются один раз: перед участком добавляется
+    "_cseN выражение =", а вхождения заменяются на _cseN. rpn_to_java
+    пишет такое присваивание отдельным оператором перед тем, в котором
+    участок, поэтому заменяются только участки с начала оператора (стек
+    перед ними пуст): иначе выражение вычислялось бы раньше вызова, который
+    стоит перед ним в том же операторе (f(l) + l[0] * l[0] + l[0] * l[0])."""
+    names = {value for kind, value in rpn if kind == OPERAND}
+    counter = 0
+    out = []
+    created = 0
+    group = 0
+    # выражения участка: (начало, конец) и цели присваивания
+    spans = []
+    targets = []
+    # стек пуст в начале участка
+    statement_start = True
+    for k, popped, pushed, depth in simulate(rpn):
+        kind, value = rpn[k]
+        if pushed is not None and pushed.pure and pushed.start >= group and k > pushed.start:
+            spans.append((pushed.start, k + 1))
+        if kind == OPERATOR and value in ASSIGNMENTS and popped:
+            targets.append((popped[0].start, popped[1].start))
+        barrier = not (kind in (OPERAND, STRING, SEPARATOR) or kind == OPERATOR and (value in PURE_BINARY or value == 'not')
+                       or kind in (BEGIN, END) and value not in STATEMENT_BLOCKS)
+        if not barrier and k + 1 < len(rpn):
+            continue
+
+        # повторы: сначала самые длинные, вхождения не пересекаются
+        occurrences = {}
+        for start, end in spans if statement_start else ():
+            if any(target_start <= start and end <= target_end for target_start, target_end in targets):
+                continue
+            occurrences.setdefault(tuple(rpn[start:end]), []).append((start, end))
+        chosen = []
+        for key in sorted(occurrences, key=len, reverse=True):
+            free = [span for span in occurrences[key]
+                    if not any(span[0] < end and start < span[1] for start, end, _ in chosen)]
+            if len(free) < 2:
+                continue
+            counter += 1
+            name = '%s%d' % (prefix, counter)
+            while name in names:
+                counter += 1
+                name = '%s%d' % (prefix, counter)
+            out += [(OPERAND, name), *key, (OPERATOR, '=')]
+            chosen += [(start, end, name) for start, end in free]
+            created += 1
+        replaced = {start: (end, name) for start, end, name in chosen}
+        position = group
+        while position <= k:
+            if position in replaced:
+                end, name = replaced[position]
+                out.append((OPERAND, name))
+                position = end
+            else:
+                out.append(rpn[position])
+                position += 1
+        group = k + 1
+        spans = []
+        targets = []
+        statement_start = depth == 0
+    return out, created
+
+
+def function_ranges(rpn):
+    # функция -> [(позиция заголовка, позиция КФ)]
+    ranges = {}
+    opened = []
+    for k, (kind, value) in enumerate(rpn):
+        if kind == FUNCTION:
+            opened.append((value[0], k))
+        elif kind == END and value == 'КФ' and opened:
+            name, start = opened.pop()
+            ranges.setdefault(name, []).append((start, k))
+    return ranges
+
+
+def eliminate_dead_code(rpn):
+    """Удаляет присваивания "x выражение =" без вызовов, если x нигде не
+    читается, и функции, имя которых не встречается вне их тела. Повторяет,
+    пока есть что удалять: удаление одного делает ненужным другое."""
+    stores = functions = 0
+    while True:
+        # присваивания, которые можно удалить: цель - одно имя, значение - чистое
+        candidates = []
+        for k, popped, pushed, _ in simulate(rpn):
+            kind, value = rpn[k]
+            if kind == OPERATOR and value == '=' and popped:
+                target, assigned = popped
+                if rpn[target.start][0] == OPERAND and assigned.start == target.start + 1 and assigned.pure:
+                    candidates.append((target.start, k))
+        targets = {start for start, _ in candidates}
+        reads = {}
+        for k, (kind, value) in enumerate(rpn):
+            if kind == OPERAND and k not in targets:
+                reads.setdefault(value, []).append(k)
+
+        removed = []
+        for start, end in candidates:
+            if rpn[start][1] not in reads:
+                removed.append((start, end))
+                stores += 1
+        for name, ranges in function_ranges(rpn).items():
+            outside = [k for k in reads.get(name, ()) if not any(start <= k <= end for start, end in ranges)]
+            if not outside and len(ranges) == 1:
+                removed.append(ranges[0])
+                functions += 1
+        if not removed:
+            return rpn, stores + functions
+
+        drop = [False] * len(rpn)
+        for start, end in removed:
+            for k in range(start, end + 1):
+                drop[k] = True
+        rpn = [instruction for instruction, dropped in zip(rpn, drop) if not dropped]
+
+
+PASSES = (
+    ('fold', fold_constants),
+    ('cse', eliminate_common_subexpressions),
+    ('dce', eliminate_dead_code),
+)
+
+
+def optimize(rpn, passes=PASSES):
+    """Прогоняет ОПЗ через проходы passes. Возвращает новую ОПЗ и
+    статистику: для каждого прохода (имя, число замен, команд до, после)."""
+    stats = []
+    for name, optimization in passes:
+        before = len(rpn)
+        rpn, changes = optimization(rpn)
+        stats.append((name, changes, before, len(rpn)))
+    return rpn, stats
+
+
+def format_stats(stats):
+    return "\n".join("%s: %d замен, команд %d -> %d" % row for row in stats)
@@ -0,0 +1,80 @@
+import contextlib
+import io
+import unittest
+
+import main
+from optimize import constant, optimize, fold_constants, eliminate_common_subexpressions
+from rpn import LAB3_DIALECT, render_rpn
+
+
+def python_to_rpn(source_code):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return main.python_to_rpn(source_code)
+
+
+def optimized_text(source_code, passes):
+    rpn, _ = optimize(python_to_rpn(source_code), passes)
+    return render_rpn(rpn, LAB3_DIALECT)
+
+
+def fold(source_code):
+    return optimized_text(source_code, (('fold', fold_constants),))
+
+
+def cse(source_code):
+    return optimized_text(source_code, (('cse', eliminate_common_subexpressions),))
+
+
+class ConstantTest(unittest.TestCase):
+    def test_numbers(self):
+        self.assertEqual(constant('2'), 2)
+        self.assertEqual(constant('3.5'), 3.5)
+        self.assertEqual(constant('-1'), -1)
+        self.assertEqual(constant('-2.5'), -2.5)
+        self.assertEqual(constant('(1+2j)'), 1 + 2j)
+
+    def test_not_numbers(self):
+        for text in ('x', '-', '-x', '', '_cse1', None):
+            with self.subTest(text=text):
+                self.assertIsNone(constant(text))
+
+
+class FoldTest(unittest.TestCase):
+    def test_numbers_are_folded(self):
+        self.assertEqual(fold('x = 2 * 3 + 1\n'), 'x 7 =')
+
+    def test_strings_are_not_folded(self):
+        # строки в ОПЗ без кавычек, но это команды STRING, а не числа
+        self.assertEqual(fold("x = '2' * 3\n"), 'x 2 3 * =')
+        self.assertEqual(fold("x = '1' + '2'\n"), 'x 1 2 + =')
+
+    def test_string_comparison_keeps_both_branches(self):
+        source = "if '1' == '1.0':\n    print(1)\nelse:\n    print(2)\n"
+        self.assertEqual(fold(source), '1 1.0 == M1_УПЛ print 1 1Ф М2_БП_М1 print 2 1Ф М2')
+
+    def test_negative_results_fold_further(self):
+        self.assertEqual(fold('x = 2 - 3 - 4\n'), 'x -5 =')
+        self.assertEqual(fold('x = (2 - 3) * 4\n'), 'x -4 =')
+
+    def test_constant_comparison_keeps_one_branch(self):
+        self.assertEqual(fold('if 2 - 3 < 0:\n    print(1)\nelse:\n    print(2)\n'), 'print 1 1Ф')
+        self.assertEqual(fold('if 1 == 2:\n    print(1)\nelse:\n    print(2)\n'), 'print 2 1Ф')
+        self.assertEqual(fold('if 1 == 1.0:\n    print(1)\nprint(3)\n'), 'print 1 1Ф print 3 1Ф')
+
+
+class CommonSubexpressionTest(unittest.TestCase):
+    def test_repeated_expression(self):
+        self.assertEqual(cse('x = l[0] * l[0] + l[0] * l[0]\n'),
+                         '_cse1 l 0 АЭМ l 0 АЭМ * = x _cse1 _cse1 + =')
+
+    def test_not_hoisted_across_call(self):
+        # l[0] нельзя читать раньше, чем выполнится f(l)
+        source = 'x = f(l) + l[0] * l[0] + l[0] * l[0]\n'
+        self.assertEqual(cse(source), 'x f l 1Ф l 0 АЭМ l 0 АЭМ * + l 0 АЭМ l 0 АЭМ * + =')
+        with contextlib.redirect_stdout(io.StringIO()):
+            java = main.rpn_to_java(optimize(python_to_rpn(source))[0])
+        self.assertNotIn('_cse', java)
+
+
+if __name__ == '__main__':
+    unittest.main()
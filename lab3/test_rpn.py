@@ -0,0 +1,260 @@
+import ast
+import contextlib
+import io
+import os
+import random
+import unittest
+
+import main
+from rpn import LAB3_DIALECT, render_rpn, parse_rpn
+
+# Проверка ОПЗ против рекурсивного перевода исходной версии lab3 (до
+# промежуточного представления rpn.py и обхода с явным стеком): тот же
+# порядок слов, разница - только в пробелах. Исходная версия склеивала
+# строки с пробелом в конце и убирала двойные пробелы одним проходом
+# replace('  ', ' '), поэтому местами (например, '=  [ ]' после числа)
+# оставался двойной пробел, а rpn_to_java получал из него пустое слово.
+# Теперь слова всегда разделены одним пробелом.
+
+
+def is_number(node):
+    return (isinstance(node, ast.Constant) and isinstance(node.value, (int, float, complex))
+            and not isinstance(node.value, bool))
+
+
+def reference_convert(node):
+    if isinstance(node, ast.BinOp):
+        left = reference_convert(node.left)
+        right = reference_convert(node.right)
+        return left + right + main.binaryOperationNameToSymbol.get(node.op.__class__.__name__) + " "
+    elif is_number(node):
+        return str(node.value) + " "
+    elif isinstance(node, ast.Expr):
+        return reference_convert(node.value)
+    elif isinstance(node, ast.FunctionDef):
+        args = ",".join([arg.arg for arg in node.args.args])
+        body = " ".join([reference_convert(n) for n in node.body])
+        return node.name + "(" + args + ") " + "НФ " + body + "КФ "
+    elif isinstance(node, ast.Assign):
+        target = reference_convert(node.targets[0])
+        value = reference_convert(node.value)
+        return target + value + "= "
+    elif isinstance(node, ast.Compare):
+        left = reference_convert(node.left)
+        ops = " ".join([main.compareEqNameToSymbol.get(op.__class__.__name__) for op in node.ops])
+        comparators = " ".join([reference_convert(comp) for comp in node.comparators])
+        return left + comparators + ops + " "
+    elif isinstance(node, ast.Return):
+        return reference_convert(node.value) + "return "
+    elif isinstance(node, ast.Yield):
+        return reference_convert(node.value) + "yield "
+    elif isinstance(node, ast.AugAssign):
+        target = reference_convert(node.target)
+        value = reference_convert(node.value)
+        return target + value + main.compareAugAssignNameToSymbol.get(node.op.__class__.__name__) + " "
+    elif isinstance(node, ast.For):
+        target = reference_convert(node.target)
+        iter = reference_convert(node.iter)
+        body = " ".join([reference_convert(n) for n in node.body])
+        return target + iter + "in " + "НИЦ " + body + "КИЦ "
+    elif isinstance(node, ast.While):
+        test = reference_convert(node.test)
+        body = " ".join([reference_convert(n) for n in node.body])
+        return test + "НУЦ " + body + "КУЦ "
+    elif isinstance(node, ast.List):
+        elts = ", ".join([reference_convert(elt).strip() for elt in node.elts])
+        return " [ " + elts + " ] "
+    elif isinstance(node, ast.Dict):
+        keys = [reference_convert(key) for key in node.keys]
+        values = [reference_convert(value) for value in node.values]
+        return " { " + ", ".join([k + ": " + v for k, v in zip(keys, values)]) + " } "
+    elif isinstance(node, ast.Attribute):
+        return reference_convert(node.value) + node.attr + " "
+    elif isinstance(node, ast.Call):
+        args = [reference_convert(arg) for arg in node.args]
+        return node.func.id + " " + "".join(args) + str(len(node.args)) + "Ф "
+    elif isinstance(node, ast.If):
+        test = reference_convert(node.test)
+        body = " ".join([reference_convert(n) for n in node.body])
+        if len(node.orelse) == 0:
+            return test + "M1_УПЛ " + body + "М1 "
+        orelse = " ".join([reference_convert(n) for n in node.orelse])
+        return test + "M1_УПЛ " + body + "М2_БП_М1 " + orelse + "М2 "
+    elif isinstance(node, ast.Subscript):
+        return reference_convert(node.value) + reference_convert(node.slice) + "АЭМ "
+    elif isinstance(node, ast.Slice):
+        lower = reference_convert(node.lower) if node.lower is not None else ""
+        upper = reference_convert(node.upper) if node.upper is not None else ""
+        step = reference_convert(node.step) if node.step is not None else ""
+        return lower + upper + step + "SLICE "
+    elif isinstance(node, ast.UnaryOp):
+        return reference_convert(node.operand) + main.compareUnaryNameToSymbol.get(node.op.__class__.__name__) + " "
+    elif isinstance(node, ast.Name):
+        return node.id + " "
+    elif isinstance(node, ast.BoolOp):
+        left = reference_convert(node.values[0])
+        right = reference_convert(node.values[1])
+        return left + right + main.compareBoolNameToSymbol.get(node.op.__class__.__name__) + " "
+    elif isinstance(node, ast.Constant):
+        return node.value + " "
+    elif isinstance(node, ast.IfExp):
+        test = reference_convert(node.test)
+        body = reference_convert(node.body)
+        orelse = reference_convert(node.orelse)
+        return test + "M1_УПЛ " + body + "М2_БП_М1 " + orelse + "М2 "
+    return ""
+
+
+def reference_rpn(source_code):
+    rpn_expression = ""
+    for node in ast.parse(source_code).body:
+        rpn_expression += reference_convert(node)
+    return rpn_expression.strip().replace('  ', ' ')
+
+
+SAMPLES = [
+    open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'python.txt')).read(),
+    "a = 1\nb = 2\ndef add(x, y):\n    return x + y\nc = add(a, b)\nlst = [a, b, c]\ne = lst[0]\n"
+    "if a != b:\n    print(add(a, b))\nif c <= d:\n    print(c)\nelse:\n    print(d)\n",
+    "x = 1 + 2 * 3 - 4 / 5 // 6 % 7 ** 8\ny = x\nif x > 2 and y < 3:\n    z = x + y\nelse:\n    z = x - y\n"
+    "while z >= 0:\n    z -= 1\n    print(z)\nfor i in range(10):\n    print(i, z)\n",
+    "m = {a: 1, b: [2, [3]]}\ns = arr[1:2]\nt = arr[:2]\nu = not x\nq = 5 if x else 6\nk = x.real\n"
+    "x += 3\nx *= 2\ndef g():\n    yield 1\n",
+    "def f(x, y):\n    a = 3.5\n    return []\n",
+]
+
+
+# Случайные программы из поддерживаемых конструкций: те же слова, что и у
+# рекурсивного перевода, должен давать и обход с явным стеком.
+NAMES = ['a', 'b', 'x', 'y', 'arr']
+
+
+def random_expression(rng, depth):
+    if depth <= 0 or rng.random() < 0.3:
+        return rng.choice(NAMES + ['1', '2', '3.5', '10'])
+    choice = rng.randrange(11)
+    sub = lambda: random_expression(rng, depth - 1)
+    if choice < 3:
+        return '(%s %s %s)' % (sub(), rng.choice(['+', '-', '*', '/', '//', '%', '**']), sub())
+    if choice == 3:
+        return '(%s %s %s)' % (sub(), rng.choice(['<', '<=', '>', '>=', '==', '!=']), sub())
+    if choice == 4:
+        return '(%s %s %s)' % (sub(), rng.choice(['and', 'or']), sub())
+    if choice == 5:
+        return '(not %s)' % sub()
+    if choice == 6:
+        return '[%s]' % ', '.join(sub() for _ in range(rng.randrange(4)))
+    if choice == 7:
+        return '{%s}' % ', '.join('%s: %s' % (sub(), sub()) for _ in range(rng.randrange(3)))
+    if choice == 8:
+        return '%s(%s)' % (rng.choice(['f', 'print', 'len']), ', '.join(sub() for _ in range(rng.randrange(4))))
+    if choice == 9:
+        return '%s[%s]' % (rng.choice(NAMES), rng.choice([sub(), '1:2', ':3', '::2']))
+    return '(%s if %s else %s)' % (sub(), sub(), sub())
+
+
+def random_block(rng, depth, indent=''):
+    lines = []
+    for _ in range(rng.randint(1, 4)):
+        choice = rng.randrange(8 if depth > 0 else 3)
+        expression = random_expression(rng, 3)
+        if choice == 0:
+            lines.append('%s%s = %s' % (indent, rng.choice(NAMES), expression))
+        elif choice == 1:
+            lines.append('%s%s %s %s' % (indent, rng.choice(NAMES), rng.choice(['+=', '-=', '*=', '/=']), expression))
+        elif choice == 2:
+            lines.append('%sprint(%s)' % (indent, expression))
+        elif choice in (3, 4):
+            lines.append('%sif %s:' % (indent, expression))
+            lines += random_block(rng, depth - 1, indent + '    ')
+            if choice == 4:
+                lines.append('%selse:' % indent)
+                lines += random_block(rng, depth - 1, indent + '    ')
+        elif choice == 5:
+            lines.append('%swhile %s:' % (indent, expression))
+            lines += random_block(rng, depth - 1, indent + '    ')
+        elif choice == 6:
+            lines.append('%sfor %s in %s:' % (indent, rng.choice(NAMES), expression))
+            lines += random_block(rng, depth - 1, indent + '    ')
+        else:
+            lines.append('%sdef g%d(%s):' % (indent, rng.randrange(5), ', '.join(NAMES[:rng.randrange(3)])))
+            lines += random_block(rng, depth - 1, indent + '    ')
+            lines.append('%sreturn %s' % (indent + '    ', expression))
+    return lines
+
+
+def random_program(rng):
+    return '\n'.join(random_block(rng, 3)) + '\n'
+
+
+def recursive_rpn(node, out):
+    # те же обработчики, но рекурсивно: так работал convert_to_rpn до
+    # обхода с явным стеком
+    for item in main.nodeTypeToConverter[type(node)](node):
+        if isinstance(item, tuple):
+            out.append(item)
+        elif type(item) in main.nodeTypeToConverter:
+            recursive_rpn(item, out)
+    return out
+
+
+def rpn_text(source_code):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return render_rpn(main.python_to_rpn(source_code), LAB3_DIALECT)
+
+
+class BeforeAfterTest(unittest.TestCase):
+    def test_samples_match_reference_up_to_spaces(self):
+        for source in SAMPLES:
+            with self.subTest(source=source):
+                self.assertEqual(rpn_text(source), " ".join(reference_rpn(source).split()))
+
+    def test_double_space_is_gone(self):
+        source = "def f(x, y):\n    a = 3.5\n    return []\n"
+        self.assertEqual(reference_rpn(source), 'f(x,y) НФ a 3.5 =  [ ] return КФ')
+        self.assertEqual(rpn_text(source), 'f(x,y) НФ a 3.5 = [ ] return КФ')
+
+    def test_text_round_trip(self):
+        # атрибут в тексте - просто имя, поэтому сравниваются тексты
+        for source in SAMPLES:
+            with self.subTest(source=source):
+                text = rpn_text(source)
+                self.assertEqual(render_rpn(parse_rpn(text, LAB3_DIALECT), LAB3_DIALECT), text)
+
+
+class ExplicitStackTest(unittest.TestCase):
+    def test_generated_programs_match_reference(self):
+        rng = random.Random(17)
+        for _ in range(500):
+            source = random_program(rng)
+            with self.subTest(source=source):
+                self.assertEqual(rpn_text(source), " ".join(reference_rpn(source).split()))
+
+    def test_generated_programs_match_recursive_walk(self):
+        rng = random.Random(71)
+        for _ in range(500):
+            source = random_program(rng)
+            with self.subTest(source=source):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    expected = []
+                    for node in ast.parse(source).body:
+                        recursive_rpn(node, expected)
+                    self.assertEqual(main.python_to_rpn(source), expected)
+
+    def test_deep_expression(self):
+        # глубже предела рекурсии: рекурсивный перевод здесь не работает
+        depth = 20000
+        rpn = main.python_to_rpn('x = ' + '+'.join(['a'] * depth))
+        self.assertEqual(len(rpn), 2 * depth + 1)
+        self.assertEqual(rpn[-2:], [('operator', '+'), ('operator', '=')])
+
+    def test_too_deep_expression_is_syntax_error(self):
+        # раньше - переполнение стека C и падение процесса
+        self.assertEqual(len(main.python_to_rpn('x = ' + '+'.join(['a'] * 150000))), 300001)
+        for source in ('x = ' + '+'.join(['a'] * 400000), 'x = ' + '-' * 200000 + 'a'):
+            with self.assertRaises(SyntaxError):
+                main.python_to_rpn(source)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import pickle
+import threading
+
+# Кэш результатов трансляции на диске: ОПЗ, Java-код, результат проверки.
+# Ключ - хеш вида результата, версии транслятора и входного текста, так
+# что неизменённый текст не разбирается повторно ни при повторном нажатии
+# кнопки, ни при пакетном прогоне. Версия - хеш файлов самого транслятора
+# (всех .py в папке лабораторной): после правки main.py, rpn.py или
+# optimize.py старые записи просто перестают совпадать.
+# Каждая запись - отдельный файл; при чтении у него обновляется время
+# изменения, и при превышении max_bytes удаляются самые давно
+# использованные записи.
+TRANSLATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+# рядом с транслятором, а не в текущем каталоге: запуск из другого каталога
+# пользуется тем же кэшем
+CACHE_DIR = os.path.join(TRANSLATOR_DIR, 'gen', 'cache')
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def translator_version(directory=TRANSLATOR_DIR):
+    digest = hashlib.sha256()
+    for name in sorted(name for name in os.listdir(directory) if name.endswith('.py')):
+        digest.update(name.encode('utf-8'))
+        digest.update(b'\0')
+        with open(os.path.join(directory, name), 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class TranslationCache:
+    def __init__(self, directory=CACHE_DIR, version=None, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.version = translator_version() if version is None else version
+        self.max_bytes = max_bytes
+        # размер записей на диске; считается при первой записи
+        self.size = None
+
+    def path(self, kind, text):
+        digest = hashlib.sha256()
+        for part in (kind, self.version, text):
+            digest.update(part.encode('utf-8', 'surrogatepass'))
+            digest.update(b'\0')
+        return os.path.join(self.directory, digest.hexdigest())
+
+    def get(self, kind, text):
+        """Результат вида kind для text или None, если его нет в кэше."""
+        path = self.path(kind, text)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def put(self, kind, text, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(kind, text)
+        # пишем во временный файл, чтобы параллельные запуски не прочитали
+        # недописанную запись
+        temporary = '%s.%d.%d' % (path, os.getpid(), threading.get_ident())
+        with open(temporary, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            written = f.tell()
+        os.replace(temporary, path)
+        if self.size is None:
+            self.size = self.disk_size()
+        else:
+            self.size += written
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def cached(self, kind, text, translate):
+        """translate(text) через кэш."""
+        value = self.get(kind, text)
+        if value is None:
+            value = translate(text)
+            self.put(kind, text, value)
+        return value
+
+    def entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and len(entry.name) == 64:
+                yield entry
+
+    def disk_size(self):
+        return sum(entry.stat().st_size for entry in self.entries())
+
+    def evict(self):
+        # удаляем давно использованные записи, пока не останется 3/4 от max_bytes
+        entries = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self.entries()))
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
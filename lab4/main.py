@@ -1,10 +1,14 @@
 import ast
+import contextlib
+import sys
+import threading
 from _ast import Module, AST
-from tkinter import *
-import tkinter.scrolledtext as st
-from translate import Translator
 
-translator = Translator(from_lang="autodetect", to_lang="ru")
+from rpn import (OPERAND, STRING, ATTRIBUTE, OPERATOR, CALL, FUNCTION, BEGIN, END, SEPARATOR, JUMP_IF_FALSE, JUMP,
+                 LABEL)
+
+# переводчик сообщений об ошибках, создаётся при первой ошибке, см. get_translator
+translator = None
 
 binaryOperationNameToSymbol = {
     'Mult': '*',
@@ -44,138 +48,292 @@ compareAugAssignNameToSymbol = {
 
 
 def calcTreeNodes(node: AST | Module, result=0) -> int:
-    if isinstance(node, list):
-        return result + sum([calcTreeNodes(node, 0) for node in node])
-    elif hasattr(node, 'left'):
-        return result + calcTreeNodes(node.left, 0) + calcTreeNodes(node.right, 0)
-    elif hasattr(node, 'values'):
-        return result + sum([calcTreeNodes(node, 0) for node in node.values])
-    else:
-        return result + 1
-
-
-def convert_to_rpn(node):
-    if isinstance(node, ast.BinOp):
-        left = convert_to_rpn(node.left)
-        right = convert_to_rpn(node.right)
-        return left + right + binaryOperationNameToSymbol.get(node.op.__class__.__name__) + " "
-    elif isinstance(node, ast.Num):
-        return str(node.n) + " "
-    elif isinstance(node, ast.Expr):
-        return convert_to_rpn(node.value)
-    elif isinstance(node, ast.FunctionDef):
-        args = ", ".join([arg.arg for arg in node.args.args])
-        body = " ".join([convert_to_rpn(n) for n in node.body])
-        return node.name + "(" + args + ") " + "НФ " + body + "КФ "
-    elif isinstance(node, ast.Assign):
-        target = convert_to_rpn(node.targets[0])
-        value = convert_to_rpn(node.value)
-        return target + value + "= "
-    elif isinstance(node, ast.Compare):
-        left = convert_to_rpn(node.left)
-        ops = " ".join([compareEqNameToSymbol.get(op.__class__.__name__) for op in node.ops])
-        comparators = " ".join([convert_to_rpn(comp) for comp in node.comparators])
-        return left + comparators + ops + " "
-    elif isinstance(node, ast.Return):
-        value = convert_to_rpn(node.value)
-        return value + "return "
-    elif isinstance(node, ast.Yield):
-        value = convert_to_rpn(node.value)
-        return value + "yield "
-    elif isinstance(node, ast.AugAssign):
-        target = convert_to_rpn(node.target)
-        value = convert_to_rpn(node.value)
-        return target + value + compareAugAssignNameToSymbol.get(node.op.__class__.__name__) + " "
-    elif isinstance(node, ast.For):
-        target = convert_to_rpn(node.target)
-        print(node.target)
-        iter = convert_to_rpn(node.iter)
-        body = " ".join([convert_to_rpn(n) for n in node.body])
-        return target + iter + "in " + "НИЦ " + body + "КИЦ "
-    elif isinstance(node, ast.While):
-        test = convert_to_rpn(node.test)
-        body = " ".join([convert_to_rpn(n) for n in node.body])
-        return test + "НУЦ " + body + "КУЦ "
-    elif isinstance(node, ast.List):
-        elts = ", ".join([convert_to_rpn(elt).strip() for elt in node.elts])
-        return "[" + elts + "] "
-    elif isinstance(node, ast.Dict):
-        keys = [convert_to_rpn(key) for key in node.keys]
-        values = [convert_to_rpn(value) for value in node.values]
-        key_value_pairs = [k + ": " + v for k, v in zip(keys, values)]
-        pairs_str = ", ".join(key_value_pairs)
-        return "{ " + pairs_str + "} "
-    elif isinstance(node, ast.Attribute):
-        value = convert_to_rpn(node.value)
-        attr = node.attr
-        return value + attr + " "
-    elif isinstance(node, ast.Num):
-        return str(node.n) + " "
-    elif isinstance(node, ast.Call):
-        args = [convert_to_rpn(arg) for arg in node.args]
-        return node.func.id + " " + "".join(args) + str(calcTreeNodes(node.args)) + "Ф "
-    elif isinstance(node, ast.Expr):
-        return convert_to_rpn(node.value)
-    elif isinstance(node, ast.If):
-        test = convert_to_rpn(node.test)
-        body = " ".join([convert_to_rpn(n) for n in node.body])
-        if len(node.orelse) == 0:
-            return test + "M1 УПЛ " + body + "М1 "
-        orelse = " ".join([convert_to_rpn(n) for n in node.orelse])
-        return test + "M1 УПЛ " + body + "М2 БП М1 " + orelse + "М2 "
-    elif isinstance(node, ast.Subscript):
-        value = convert_to_rpn(node.value)
-        slice_value = convert_to_rpn(node.slice)
-        return value + slice_value + "АЭМ "
-    elif isinstance(node, ast.Slice):
-        lower = convert_to_rpn(node.lower) if node.lower is not None else ""
-        upper = convert_to_rpn(node.upper) if node.upper is not None else ""
-        step = convert_to_rpn(node.step) if node.step is not None else ""
-        return lower + upper + step + "SLICE "
-    elif isinstance(node, ast.UnaryOp):
-        operand = convert_to_rpn(node.operand)
-        return operand + compareUnaryNameToSymbol.get(node.op.__class__.__name__) + " "
-    elif isinstance(node, ast.Name):
-        return node.id + " "
-    elif isinstance(node, ast.BoolOp):
-        if len(node.values) == 2:
-            left = convert_to_rpn(node.values[0])
-            right = convert_to_rpn(node.values[1])
-            return left + right + compareBoolNameToSymbol.get(node.op.__class__.__name__) + " "
+    # число листьев: элементы списков, операнды BinOp и BoolOp; обход с
+    # явным стеком, как и в convert_to_rpn
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif hasattr(node, 'left'):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif hasattr(node, 'values'):
+            stack.extend(node.values)
         else:
-            print(node.op, node.values)
-    elif isinstance(node, ast.Constant):
-        return node.value + " "
-    elif isinstance(node, ast.IfExp):
-        test = convert_to_rpn(node.test)
-        body = convert_to_rpn(node.body)
-        orelse = convert_to_rpn(node.orelse)
-        return test + "M1 УПЛ " + body + "М2 БП М1 " + orelse + "М2 "
-    else:
-        print(node)
-        return ""
+            result += 1
+    return result
+
+
+# глубина рекурсии и размер стека потока для ast.parse, см. parse_python
+PARSE_RECURSION_LIMIT = 100000
+# PARSE_RECURSION_LIMIT уровней вместе с освобождением недостроенного
+# дерева при ошибке умещаются в 32 МБ; здесь - с запасом вдвое
+PARSE_STACK_SIZE = 64 * 1024 * 1024
+
+# предел рекурсии общий для всех потоков процесса, поэтому глубокие
+# разборы идут по одному, см. parse_python
+deepParseLock = threading.Lock()
+
+# результаты prog по тексту программы, см. cache.py
+translationCache = None
+
+
+# Обработчики узлов AST для convert_to_rpn: тип узла -> функция, которая
+# возвращает ОПЗ узла как список: узлы AST (их ОПЗ подставляется на это
+# место) и готовые команды rpn.py. Обработчики не вызывают друг друга, так
+# что глубина дерева ограничена только памятью, а не стеком Python. Новый
+# тип узла добавляется декоратором converts.
+nodeTypeToConverter = {}
+
+
+def converts(*node_types):
+    def register(converter):
+        for node_type in node_types:
+            nodeTypeToConverter[node_type] = converter
+        return converter
+    return register
+
+
+def convert_to_rpn(node, out):
+    """Дописывает в out команды ОПЗ узла. Обход - с явным стеком:
+    на вершине - итератор по списку ещё не разобранного узла."""
+    stack = [iter((node,))]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, tuple):
+                out.append(item)
+                continue
+            converter = nodeTypeToConverter.get(type(item))
+            if converter is None:
+                print(item)
+                continue
+            stack.append(iter(converter(item)))
+            break
+        else:
+            stack.pop()
+    return out
+
+
+@converts(ast.Name)
+def convert_name(node):
+    return [(OPERAND, node.id)]
+
+
+@converts(ast.Constant)
+def convert_constant(node):
+    # числа (как проверка isinstance(node, ast.Num): bool - не число) и строки
+    if isinstance(node.value, (int, float, complex)) and not isinstance(node.value, bool):
+        return [(OPERAND, str(node.value))]
+    if isinstance(node.value, str):
+        return [(STRING, node.value)]
+    raise TypeError('unsupported constant %r' % (node.value,))
+
+
+@converts(ast.BinOp)
+def convert_bin_op(node):
+    return [node.left, node.right, (OPERATOR, binaryOperationNameToSymbol[node.op.__class__.__name__])]
+
+
+@converts(ast.Expr)
+def convert_expr(node):
+    return [node.value]
+
+
+@converts(ast.FunctionDef)
+def convert_function_def(node):
+    return [(FUNCTION, (node.name, [arg.arg for arg in node.args.args])), (BEGIN, "НФ"),
+            *node.body, (END, "КФ")]
+
+
+@converts(ast.Assign)
+def convert_assign(node):
+    return [node.targets[0], node.value, (OPERATOR, "=")]
+
+
+@converts(ast.Compare)
+def convert_compare(node):
+    return [node.left, *node.comparators,
+            *[(OPERATOR, compareEqNameToSymbol[op.__class__.__name__]) for op in node.ops]]
+
+
+@converts(ast.Return)
+def convert_return(node):
+    return [node.value, (OPERATOR, "return")]
+
+
+@converts(ast.Yield)
+def convert_yield(node):
+    return [node.value, (OPERATOR, "yield")]
+
+
+@converts(ast.AugAssign)
+def convert_aug_assign(node):
+    return [node.target, node.value, (OPERATOR, compareAugAssignNameToSymbol[node.op.__class__.__name__])]
+
+
+@converts(ast.For)
+def convert_for(node):
+    print(node.target)
+    return [node.target, node.iter, (OPERATOR, "in"), (BEGIN, "НИЦ"), *node.body, (END, "КИЦ")]
+
+
+@converts(ast.While)
+def convert_while(node):
+    return [node.test, (BEGIN, "НУЦ"), *node.body, (END, "КУЦ")]
+
+
+@converts(ast.List)
+def convert_list(node):
+    items = [(BEGIN, "[")]
+    for k, elt in enumerate(node.elts):
+        if k:
+            items.append((SEPARATOR, ","))
+        items.append(elt)
+    items.append((END, "]"))
+    return items
+
+
+@converts(ast.Dict)
+def convert_dict(node):
+    items = [(BEGIN, "{")]
+    for k, (key, value) in enumerate(zip(node.keys, node.values)):
+        if k:
+            items.append((SEPARATOR, ","))
+        items += [key, (SEPARATOR, ":"), value]
+    items.append((END, "}"))
+    return items
+
+
+@converts(ast.Attribute)
+def convert_attribute(node):
+    return [node.value, (ATTRIBUTE, node.attr)]
+
+
+@converts(ast.Call)
+def convert_call(node):
+    return [(OPERAND, node.func.id), *node.args, (CALL, (len(node.args), calcTreeNodes(node.args)))]
+
+
+@converts(ast.If)
+def convert_if(node):
+    if len(node.orelse) == 0:
+        return [node.test, (JUMP_IF_FALSE, "M1"), *node.body, (LABEL, "М1")]
+    return [node.test, (JUMP_IF_FALSE, "M1"), *node.body, (JUMP, "М2"), (LABEL, "М1"),
+            *node.orelse, (LABEL, "М2")]
+
+
+@converts(ast.IfExp)
+def convert_if_exp(node):
+    return [node.test, (JUMP_IF_FALSE, "M1"), node.body, (JUMP, "М2"), (LABEL, "М1"),
+            node.orelse, (LABEL, "М2")]
+
+
+@converts(ast.Subscript)
+def convert_subscript(node):
+    return [node.value, node.slice, (OPERATOR, "АЭМ")]
+
+
+@converts(ast.Slice)
+def convert_slice(node):
+    return [part for part in (node.lower, node.upper, node.step) if part is not None] + [(OPERATOR, "SLICE")]
+
+
+@converts(ast.UnaryOp)
+def convert_unary_op(node):
+    return [node.operand, (OPERATOR, compareUnaryNameToSymbol[node.op.__class__.__name__])]
+
+
+@converts(ast.BoolOp)
+def convert_bool_op(node):
+    if len(node.values) != 2:
+        print(node.op, node.values)
+        raise TypeError('%s with %d operands is not supported' % (node.op.__class__.__name__, len(node.values)))
+    return [node.values[0], node.values[1], (OPERATOR, compareBoolNameToSymbol[node.op.__class__.__name__])]
+
+
+def parse_python(source_code):
+    # ast.parse сам ограничен глубиной рекурсии интерпретатора, а
+    # сгенерированные выражения бывают вложены на тысячи уровней. Предел
+    # поднимается только на время разбора в отдельном потоке со стеком
+    # PARSE_STACK_SIZE: на обычном стеке парсер на C переполнил бы его раньше,
+    # чем сработает предел, и процесс бы упал. Программа, которая не
+    # разбирается и так, - SyntaxError, как любая другая ошибка в тексте.
+    # Обычные программы разбираются сразу, без потока.
+    try:
+        return ast.parse(source_code)
+    except (RecursionError, MemoryError):
+        pass
+
+    outcome = []
+
+    def parse():
+        with deepParseLock:
+            limit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(limit, PARSE_RECURSION_LIMIT))
+            try:
+                outcome.append(ast.parse(source_code))
+            except Exception as error:
+                outcome.append(error)
+            finally:
+                sys.setrecursionlimit(limit)
+
+    stack_size = threading.stack_size(PARSE_STACK_SIZE)
+    try:
+        thread = threading.Thread(target=parse)
+        thread.start()
+    finally:
+        threading.stack_size(stack_size)
+    thread.join()
+
+    result, = outcome
+    if isinstance(result, (RecursionError, MemoryError)):
+        raise SyntaxError('program is nested too deeply to translate', ('<unknown>', 1, 0, None)) from result
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def get_translation_cache():
+    # версия кэша - хеш файлов транслятора (см. cache.py): считается при
+    # первой трансляции, а не при импорте main
+    global translationCache
+    if translationCache is None:
+        from cache import TranslationCache
+        translationCache = TranslationCache()
+    return translationCache
+
+
+def get_translator():
+    # translate тянет за собой requests и ходит в сеть: импорт main и
+    # программы без ошибок обходятся без него
+    global translator
+    if translator is None:
+        from translate import Translator
+        translator = Translator(from_lang="autodetect", to_lang="ru")
+    return translator
 
 
 def python_to_rpn(source_code):
     try:
-        tree = ast.parse(source_code)
-        rpn_expression = ""
+        tree = parse_python(source_code)
+        rpn = []
         for node in tree.body:
-            rpn_expression += convert_to_rpn(node)
+            convert_to_rpn(node, rpn)
 
         return "Ошибок нет"
     except Exception as error:
         text = str(error)
         print(text)
-        res = translator.translate(text
-                                   .replace("(<unknown>", "")
-                                   .split(",")[0]
-                                   ).replace("никогда", "").replace("непревзойденный", "Не обнаружена открывающая пара")
+        res = get_translator().translate(text
+                                         .replace("(<unknown>", "")
+                                         .split(",")[0]
+                                         ).replace("никогда", "").replace("непревзойденный", "Не обнаружена открывающая пара")
 
-        res2 = translator.translate(text
-                                    .replace("(<unknown>", "")
-                                    .split(",")[1]
-                                    )
+        res2 = get_translator().translate(text
+                                          .replace("(<unknown>", "")
+                                          .split(",")[1]
+                                          )
 
 
         return res + " \n" + res2.replace(')', "")
@@ -186,7 +344,7 @@ def prog():
     input_sequence = f.read()
     f.close()
 
-    out_seq = python_to_rpn(input_sequence)
+    out_seq = get_translation_cache().cached('check', input_sequence, python_to_rpn)
 
     # файл, содержащий обратную польскую запись
     f = open('gen/error_text.txt', 'w')
@@ -199,35 +357,59 @@ def write_txt(data, to):
         file.write(data)
 
 
-def clicked():
-    write_txt(codetxt.get("1.0", "end"), 'resources/python.txt')
+def gui():
+    # tkinter загружается только для окна, см. startup.py
+    import tkinter as tk
+    import tkinter.scrolledtext as st
+
+    def clicked():
+        write_txt(codetxt.get("1.0", "end"), 'resources/python.txt')
 
-    errorText.delete("1.0", END)
+        errorText.delete("1.0", "end")
 
-    prog()
+        prog()
 
-    f1 = open('gen/error_text.txt', 'r')
+        f1 = open('gen/error_text.txt', 'r')
+        text = f1.read()
+        errorText.insert("1.0", text)
+        f1.close()
+
+    window = tk.Tk()
+    window.title("LR4")
+
+    f1 = open('resources/python.txt', 'r')
     text = f1.read()
-    errorText.insert("1.0", text)
-    f1.close()
 
+    window.geometry('1340x640')
 
-window = Tk()
-window.title("LR4")
+    codetxt = st.ScrolledText(window, font=("Arial", 18))
+    codetxt.insert("1.0", text)
+    codetxt.place(x=20, y=20, width=500, height=600)
 
-f1 = open('resources/python.txt', 'r')
-text = f1.read()
+    errorText = st.ScrolledText(window, font=("Arial", 18))
+    errorText.place(x=820, y=20, width=500, height=600)
 
-window.geometry('1340x640')
+    btngo = tk.Button(window, text="Проверить \n ошибки", command=clicked, font=("Arial", 20))
+    btngo.place(x=510 + 150 - 100, y=10 + 300 - 40, width=200, height=80)
 
-codetxt = st.ScrolledText(window, font=("Arial", 18))
-codetxt.insert("1.0", text)
-codetxt.place(x=20, y=20, width=500, height=600)
+    window.mainloop()
 
-errorText = st.ScrolledText(window, font=("Arial", 18))
-errorText.place(x=820, y=20, width=500, height=600)
 
-btngo = Button(window, text="Проверить \n ошибки", command=clicked, font=("Arial", 20))
-btngo.place(x=510 + 150 - 100, y=10 + 300 - 40, width=200, height=80)
+# Без аргументов открывается окно, как раньше; с файлом - проверка без окна:
+#   python main.py resources/python.txt [-o gen/error_text.txt]
+if __name__ == '__main__':
+    # argparse - половина времени импорта main, нужен только здесь
+    import argparse
 
-window.mainloop()
+    parser = argparse.ArgumentParser(description='Проверка программы на Python на ошибки')
+    parser.add_argument('source', nargs='?', help='без аргументов открывается окно')
+    parser.add_argument('-o', '--out', help='файл результата (по умолчанию - стандартный вывод)')
+    args = parser.parse_args()
+    if args.source is None:
+        gui()
+    else:
+        # отладочная печать разбора уходит в stderr, в stdout - только результат
+        with open(args.source, 'r') as source, \
+                (open(args.out, 'w') if args.out else contextlib.nullcontext(sys.stdout)) as target, \
+                contextlib.redirect_stdout(sys.stderr):
+            target.write(get_translation_cache().cached('check', source.read(), python_to_rpn))
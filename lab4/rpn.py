@@ -0,0 +1,184 @@
+# Промежуточное представление ОПЗ: список команд (вид, значение).
+# python_to_rpn строит его без склеивания строк, rpn_to_java читает его
+# напрямую; текст ОПЗ (gen/rpn.txt) - только выгрузка через render_rpn.
+#
+# Виды команд:
+#   OPERAND        - имя, число
+#   STRING         - строковый литерал, значение - текст строки (в тексте
+#                    ОПЗ - просто слово без кавычек, parse_rpn читает его
+#                    как OPERAND)
+#   ATTRIBUTE      - имя атрибута: значение на вершине стека заменяется его
+#                    атрибутом (в тексте ОПЗ - просто имя)
+#   OPERATOR       - операция: = + - ... and or not in return yield АЭМ SLICE
+#   CALL           - вызов функции, значение - число аргументов (NФ) или
+#                    пара (число аргументов, N) - тогда в тексте пишется N
+#   FUNCTION       - заголовок функции, значение - (имя, [параметры])
+#   BEGIN, END     - начало и конец блока: НФ/КФ, НИЦ/КИЦ, НУЦ/КУЦ, [ ], { }
+#   SEPARATOR      - ',' между элементами списка и словаря, ':' в словаре
+#   JUMP_IF_FALSE  - условный переход на метку (M1 УПЛ)
+#   JUMP           - безусловный переход на метку (М2 БП)
+#   LABEL          - метка (М1, М2)
+OPERAND = 'operand'
+STRING = 'string'
+ATTRIBUTE = 'attribute'
+OPERATOR = 'operator'
+CALL = 'call'
+FUNCTION = 'function'
+BEGIN = 'begin'
+END = 'end'
+SEPARATOR = 'separator'
+JUMP_IF_FALSE = 'jump_if_false'
+JUMP = 'jump'
+LABEL = 'label'
+
+# слова текста ОПЗ, которые parse_rpn читает как операции и метки
+OPERATORS = {
+    '=', '+', '-', '*', '/', '//', '%', '**', '==', '!=', '<', '<=', '>', '>=', 'and', 'or', 'not',
+    'in', 'return', 'yield', 'АЭМ', 'SLICE', '+=', '-=', '*=', '/=', '**=',
+}
+
+LABELS = {'М1', 'М2'}
+
+# Запись ОПЗ в тексте лабораторных работ
+LAB2_DIALECT = {
+    'params': ', ',
+    'jump_if_false': '%s УПЛ',
+    'jump': '%s БП',
+    'glue_jump': False,
+    # скобки списка приклеены к первому и последнему элементу
+    'glue_list': True,
+}
+
+LAB3_DIALECT = {
+    'params': ',',
+    'jump_if_false': '%s_УПЛ',
+    'jump': '%s_БП',
+    # метка после БП пишется через '_' в одно слово с ним
+    'glue_jump': True,
+    'glue_list': False,
+}
+
+
+def word(instruction, dialect):
+    """Одна команда как слово текста ОПЗ."""
+    kind, value = instruction
+    if kind == CALL:
+        return str(value[1] if isinstance(value, tuple) else value) + "Ф"
+    if kind == FUNCTION:
+        name, params = value
+        return name + "(" + dialect['params'].join(params) + ")"
+    if kind == JUMP_IF_FALSE:
+        return dialect['jump_if_false'] % value
+    if kind == JUMP:
+        return dialect['jump'] % value
+    return value
+
+
+def render_words(rpn, dialect):
+    words = []
+    brackets = []
+    prefix = ''
+    glue = False
+    for instruction in rpn:
+        kind, value = instruction
+        if kind == BEGIN and value in '[{':
+            brackets.append(value)
+            if value == '[' and dialect['glue_list']:
+                prefix += '['
+                continue
+        elif kind == END and value in ']}':
+            brackets.pop()
+            if value == ']' and dialect['glue_list']:
+                if prefix:
+                    words.append(prefix + ']')
+                    prefix = ''
+                else:
+                    words[-1] += ']'
+                continue
+        elif kind == SEPARATOR and value == ',' and brackets[-1] == '[':
+            # элементы списка: "1, 2"
+            words[-1] += ','
+            continue
+        text = word(instruction, dialect)
+        if glue:
+            words[-1] += '_' + text
+        else:
+            words.append(prefix + text)
+        prefix = ''
+        glue = kind == JUMP and dialect['glue_jump']
+    return words
+
+
+def render_rpn(rpn, dialect):
+    """Текст ОПЗ в том виде, в каком его пишет в gen/rpn.txt prog."""
+    return " ".join(render_words(rpn, dialect))
+
+
+def parse_rpn(text, dialect):
+    """Обратное к render_rpn: команды из текста ОПЗ (например,
+    исправленного вручную в окне программы)."""
+    rpn = []
+    brackets = []
+    # 'УПЛ'/'БП' в lab2 - отдельные слова после метки, в lab3 - '_УПЛ'/'_БП'
+    # в одном слове с меткой
+    jump_if_false = dialect['jump_if_false'] % ''
+    jump = dialect['jump'] % ''
+    words = iter(text.split())
+    for text_word in words:
+        if '(' in text_word and not text_word.endswith(')'):
+            # заголовок функции lab2 "f(a, b)" - несколько слов
+            for rest in words:
+                text_word += ' ' + rest
+                if rest.endswith(')'):
+                    break
+        while text_word.startswith('[') and len(text_word) > 1:
+            rpn.append((BEGIN, '['))
+            brackets.append('[')
+            text_word = text_word[1:]
+        closing = 0
+        while text_word.endswith(']') and len(text_word) > 1:
+            closing += 1
+            text_word = text_word[:-1]
+        separator = text_word.endswith(',') and len(text_word) > 1
+        if separator:
+            text_word = text_word[:-1]
+
+        if text_word in ('НФ', 'НИЦ', 'НУЦ', '[', '{'):
+            rpn.append((BEGIN, text_word))
+            if text_word in '[{':
+                brackets.append(text_word)
+        elif text_word in ('КФ', 'КИЦ', 'КУЦ', ']', '}'):
+            rpn.append((END, text_word))
+            if text_word in ']}' and brackets:
+                brackets.pop()
+        elif text_word in (',', ':') and brackets:
+            rpn.append((SEPARATOR, text_word))
+        elif text_word in OPERATORS:
+            rpn.append((OPERATOR, text_word))
+        elif text_word.endswith('Ф') and text_word[:-1].isdigit():
+            rpn.append((CALL, int(text_word[:-1])))
+        elif text_word.endswith(')') and '(' in text_word:
+            name, params = text_word[:-1].split('(', 1)
+            rpn.append((FUNCTION, (name, [param.strip() for param in params.split(',')] if params else [])))
+        elif text_word in (jump_if_false.strip(), jump.strip()) and rpn:
+            label = rpn.pop()[1]
+            rpn.append((JUMP_IF_FALSE if text_word == jump_if_false.strip() else JUMP, label))
+        elif text_word.endswith(jump_if_false):
+            rpn.append((JUMP_IF_FALSE, text_word[:-len(jump_if_false)]))
+        elif jump in text_word:
+            label, target = text_word.split(jump, 1)
+            rpn.append((JUMP, label))
+            if target.startswith('_'):
+                rpn.append((LABEL, target[1:]))
+        elif text_word in LABELS:
+            rpn.append((LABEL, text_word))
+        else:
+            rpn.append((OPERAND, text_word))
+
+        if separator:
+            rpn.append((SEPARATOR, ','))
+        for _ in range(closing):
+            rpn.append((END, ']'))
+            if brackets:
+                brackets.pop()
+    return rpn